@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+
+import argparse, gc, json, os, platform, random, subprocess, sys, time, tracemalloc
+import numpy as np
+
+'''
+Benchmarks for the hot paths of lang2vec: import time, get_features for every feature set
+and for union/concatenation expressions, and distance() for pairs and full matrices.
+Runs offline against the bundled data files; feature sets or distances whose files are
+not installed are reported as skipped. Results are written as JSON, and two runs can be
+compared with --compare.
+
+    python benchmarks/run_benchmarks.py -o before.json
+    python benchmarks/run_benchmarks.py -o after.json --compare before.json
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lang2vec import lang2vec as l2v
+
+EXPRESSIONS = [
+    "syntax_wals|syntax_sswl|syntax_ethnologue",
+    "phonology_wals|phonology_ethnologue",
+    "syntax_knn+phonology_knn+inventory_knn",
+    "syntax_average+fam",
+    "syntax_wals|syntax_sswl+inventory_knn",
+]
+FEATURE_SIZES = [1, 1000, 10000]
+MATRIX_SIZES = [100, 1000]
+NUM_PAIRS = 100
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+def peak_memory(function):
+    # bytes allocated through Python (numpy included) at the peak of one call
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+class Runner(object):
+    def __init__(self, repeat, memory):
+        self.repeat = repeat
+        self.memory = memory
+        self.results = []
+
+    def run(self, group, name, function, cold=None, **params):
+        result = {"group": group, "name": name, "params": params}
+        try:
+            if cold is not None:
+                cold()
+                result["cold"] = timed(function, 1)[0]
+            times = timed(function, self.repeat)
+            result.update(times=times, min=min(times), median=float(np.median(times)))
+            if self.memory:
+                result["peak_bytes"] = peak_memory(function)
+        except Exception as e:
+            result["skipped"] = str(e).strip().split("\n")[0]
+        self.results.append(result)
+        status = result.get("skipped") or "%.6fs" % result["median"]
+        print("%-10s %-48s %s" % (group, name, status), file=sys.stderr)
+        return result
+
+def bench_import(runner):
+    # in fresh interpreters, so that nothing is loaded yet
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    snippets = {
+        "import": "import lang2vec.lang2vec as l2v",
+        "import+LANGUAGES": "import lang2vec.lang2vec as l2v; l2v.LANGUAGES",
+        "import+first_query": "import lang2vec.lang2vec as l2v; l2v.get_features('eng', 'syntax_knn')",
+    }
+    for name, snippet in snippets.items():
+        code = "import time; start = time.perf_counter(); " + snippet + "; print(time.perf_counter() - start)"
+        result = {"group": "import", "name": name, "params": {}}
+        times = []
+        try:
+            for _ in range(runner.repeat):
+                times.append(float(subprocess.check_output([sys.executable, "-c", code], env=env, stderr=subprocess.DEVNULL).split()[-1]))
+            result.update(times=times, min=min(times), median=float(np.median(times)))
+        except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+            result["skipped"] = str(e)
+        runner.results.append(result)
+        print("%-10s %-48s %s" % ("import", name, result.get("skipped") or "%.6fs" % result["median"]), file=sys.stderr)
+
+def sample(population, size, seed):
+    # with replacement when more languages are requested than there are
+    rng = random.Random(seed)
+    population = sorted(population)
+    if size <= len(population):
+        return rng.sample(population, size)
+    return [ rng.choice(population) for _ in range(size) ]
+
+def bench_features(runner, sizes):
+    uriel = l2v.get_constant("URIEL_LANGUAGES")
+    learned = l2v.get_constant("LEARNED_LANGUAGES")
+    for size in sizes:
+        for feature_set in list(l2v.FEATURE_SETS_DICT) + EXPRESSIONS:
+            langs = sample(learned if feature_set == "learned" else uriel, size, seed=size)
+            runner.run("features", feature_set, lambda: l2v.get_features(langs, feature_set, output="array"),
+                       cold=l2v.clear_cache, languages=size)
+        langs = sample(uriel, size, seed=size)
+        runner.run("features", "syntax_knn (dict)", lambda: l2v.get_features(langs, "syntax_knn"), languages=size)
+
+def bench_distances(runner, sizes, num_pairs):
+    try:
+        languages = l2v.get_constant("DISTANCE_LANGUAGES")
+    except (IOError, OSError, IndexError):
+        languages = []
+    rng = random.Random(0)
+    pairs = [ rng.sample(languages, 2) for _ in range(num_pairs) ] if len(languages) > 1 else []
+    for dist in l2v.DISTANCES:
+        def pairwise():
+            if not pairs:
+                raise Exception("No distance languages installed.")
+            for lang1, lang2 in pairs:
+                l2v.distance(dist, lang1, lang2)
+        runner.run("distance", dist + " pair", pairwise, pairs=num_pairs)
+        for size in sizes:
+            langs = sample(languages, min(size, len(languages)), seed=size) if languages else []
+            runner.run("distance", dist + " matrix", lambda: l2v.distance(dist, langs), languages=size)
+
+def environment():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (subprocess.CalledProcessError, OSError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "data_dir": l2v.DATA_DIR,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def compare(results, baseline):
+    # ratio of the medians, new / old
+    old = { (r["group"], r["name"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["results"] }
+    for r in results:
+        key = (r["group"], r["name"], json.dumps(r["params"], sort_keys=True))
+        if key not in old or "median" not in r or "median" not in old[key]:
+            continue
+        ratio = r["median"] / old[key]["median"] if old[key]["median"] else float("inf")
+        print("%-10s %-48s %-22s %10.6fs -> %10.6fs  x%.2f" % (r["group"], r["name"], key[2], old[key]["median"], r["median"], ratio))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lang2vec.")
+    parser.add_argument("-o", "--output", help="JSON output file (default: stdout)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--only", choices=["import", "features", "distance"], action="append", help="benchmark groups to run (default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=FEATURE_SIZES, help="numbers of languages for get_features")
+    parser.add_argument("--matrix-sizes", type=int, nargs="+", default=MATRIX_SIZES, help="numbers of languages for distance matrices")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--data-dir", help="use the data files in this directory")
+    parser.add_argument("--compare", help="JSON output of a previous run to compare with")
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        l2v.DATA_DIR = args.data_dir
+        l2v.LETTER_CODES_FILE = os.path.join(args.data_dir, "letter_codes.json")
+        l2v.DISTANCES_FILE = os.path.join(args.data_dir, "distances2.zip")
+        l2v.DISTANCES_LANGUAGE_FILE = os.path.join(args.data_dir, "distances_languages.txt")
+
+    runner = Runner(args.repeat, not args.no_memory)
+    groups = args.only or ["import", "features", "distance"]
+    if "import" in groups and not args.data_dir:
+        bench_import(runner)
+    if "features" in groups:
+        bench_features(runner, args.sizes)
+    if "distance" in groups:
+        bench_distances(runner, args.matrix_sizes, NUM_PAIRS)
+
+    output = {"environment": environment(), "max_rss_bytes": max_rss_bytes(), "results": runner.results}
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(output, out, indent=1)
+    else:
+        json.dump(output, sys.stdout, indent=1)
+        print()
+    if args.compare:
+        with open(args.compare) as inp:
+            compare(runner.results, json.load(inp))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import sys
+
+from lang2vec.cli import main
+
+sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import asyncio, functools, os, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lang2vec import lang2vec as l2v
+
+'''
+asyncio facade: the blocking file loads and gathers of lang2vec run on a bounded pool of
+threads, so that they do not stall the event loop. Concurrent requests that need the same
+database file wait for a single load of it.
+
+    >>> from lang2vec import aio
+    >>> features = await aio.aget_features(["eng", "fra"], "syntax_knn")
+    >>> d = await aio.adistance("syntactic", "eng", "fra")
+'''
+
+MAX_WORKERS = 4
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def get_executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="lang2vec")
+        return _EXECUTOR
+
+def set_max_workers(max_workers):
+    # the running calls finish on the previous executor
+    global MAX_WORKERS, _EXECUTOR
+    with _EXECUTOR_LOCK:
+        MAX_WORKERS = max_workers
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+            _EXECUTOR = None
+
+def shutdown(wait=True):
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=wait)
+            _EXECUTOR = None
+
+async def run(function, *args, **kwargs):
+    # any blocking lang2vec call, on the executor
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(function, *args, **kwargs))
+
+async def aget_features(languages, feature_set_inp, header=False, minimal=False, **kwargs):
+    return await run(l2v.get_features, languages, feature_set_inp, header=header, minimal=minimal, **kwargs)
+
+async def adistance(distance, *args, **kwargs):
+    return await run(l2v.distance, distance, *args, **kwargs)
+
+async def adistance_pairs(distance, langs1, langs2):
+    return await run(l2v.distance_pairs, distance, langs1, langs2)
+
+async def anearest_languages(lang, distance, k=10, candidates=None):
+    return await run(l2v.nearest_languages, lang, distance, k=k, candidates=candidates)
+
+async def aload_database(filename):
+    return await run(l2v.load_database, filename)
+
+async def preload(feature_sets=None, distances=()):
+    # loads the files behind the given feature sets (default: all the installed ones) and
+    # the given distances concurrently, e.g. at the startup of a service
+    if feature_sets is None:
+        filenames = sorted(set( filename for filename, source, prefix in l2v.FEATURE_SETS_DICT.values()
+                                if os.path.exists(l2v.get_database_path(filename)) ))
+    else:
+        filenames = sorted(set( l2v.FEATURE_SETS_DICT[fs][0] for fs in feature_sets ))
+    tasks = [ aload_database(filename) for filename in filenames ]
+    tasks += [ run(l2v.load_distance_matrix, dist) for dist in distances ]
+    await asyncio.gather(*tasks)
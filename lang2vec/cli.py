@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse, itertools, sys
+import numpy as np
+
+from lang2vec import lang2vec as l2v
+
+'''
+Command line interface: streams language codes (or pairs of codes) from files or stdin,
+and processes them in fixed-size chunks through the batched get_features/distance paths,
+writing TSV or NPY output as it goes.
+
+    lang2vec features --sets syntax_knn+geo < languages.txt > features.tsv
+    lang2vec distance --metric genetic --metric syntactic --format npy -o out.npy pairs.txt
+    lang2vec export --processes 8 --sets syntax_knn out/
+    lang2vec impute --source WALS --metric genetic feature_predictions_wals.npz
+    lang2vec serve --port 8765
+'''
+
+NPY_HEADER_SIZE = 128
+
+class NpyStreamWriter(object):
+    # Appends rows to a .npy file whose number of rows is not known in advance. The
+    # header is written with a fixed size and rewritten with the final shape on close.
+    def __init__(self, path, num_columns, dtype=np.float32):
+        self.out = open(path, 'wb')
+        self.num_columns = num_columns
+        self.dtype = np.dtype(dtype)
+        self.num_rows = 0
+        self._write_header()
+
+    def _write_header(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d, %d), }" % (self.dtype.str, self.num_rows, self.num_columns)
+        prefix = b"\x93NUMPY\x01\x00"
+        padding = NPY_HEADER_SIZE - len(prefix) - 2 - len(header) - 1
+        if padding < 0:
+            raise Exception("Array shape too large for the npy header.")
+        header = (header + " " * padding + "\n").encode("latin1")
+        self.out.seek(0)
+        self.out.write(prefix + np.array(len(header), dtype='<u2').tobytes() + header)
+        self.out.seek(0, 2)
+
+    def write(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape(-1, self.num_columns)
+        self.out.write(rows.tobytes())
+        self.num_rows += len(rows)
+
+    def close(self):
+        self._write_header()
+        self.out.close()
+
+def read_tokens(paths):
+    # yields the lines of the input files (stdin for "-"), split on whitespace
+    for path in paths or ["-"]:
+        inp = sys.stdin if path == "-" else open(path)
+        try:
+            for line in inp:
+                tokens = line.split()
+                if tokens:
+                    yield tokens
+        finally:
+            if inp is not sys.stdin:
+                inp.close()
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def format_values(values, missing="--"):
+    # float32 values printed with their shortest representation, -1 as missing
+    formatted = np.asarray(values, dtype=np.float32).astype(str)
+    formatted[np.asarray(values) == -1] = missing
+    return formatted
+
+def run_features(args, out):
+    languages = ( lang for tokens in read_tokens(args.inputs) for lang in tokens )
+    writer = None
+    plan = l2v.compile_feature_sets(args.sets)
+    feature_names = [ f.replace(" ", "_") for f in plan.feature_names ]
+    if args.format == "npy":
+        writer = NpyStreamWriter(args.output, len(feature_names))
+    elif args.header:
+        out.write("\t".join(["CODE"] + feature_names) + "\n")
+    # on an error the .npy header still records the rows written so far
+    try:
+        for chunk in chunked(languages, args.chunk_size):
+            result = l2v.get_features(chunk, args.sets, output="array", dtype=np.float32, missing="mask")
+            if writer is not None:
+                values = result.values.copy()
+                values[result.mask] = np.nan
+                writer.write(values)
+                continue
+            formatted = format_values(np.where(result.mask, -1, result.values))
+            out.write("".join( lang + "\t" + "\t".join(row) + "\n" for lang, row in zip(chunk, formatted.tolist()) ))
+    finally:
+        if writer is not None:
+            writer.close()
+
+def run_distance(args, out):
+    metrics = args.metric or ["genetic"]
+    writer = None
+    if args.format == "npy":
+        writer = NpyStreamWriter(args.output, len(metrics))
+    elif args.header:
+        out.write("\t".join(["LANG1", "LANG2"] + metrics) + "\n")
+    try:
+        for chunk in chunked(read_tokens(args.inputs), args.chunk_size):
+            for tokens in chunk:
+                if len(tokens) != 2:
+                    raise Exception("Error: Expected two languages per line, got: " + " ".join(tokens))
+            langs1, langs2 = [ t[0] for t in chunk ], [ t[1] for t in chunk ]
+            values = l2v.distance_pairs(metrics, langs1, langs2).T
+            if writer is not None:
+                writer.write(values)
+                continue
+            formatted = np.asarray(values, dtype=np.float32).astype(str)
+            out.write("".join( l1 + "\t" + l2 + "\t" + "\t".join(row) + "\n" for l1, l2, row in zip(langs1, langs2, formatted.tolist()) ))
+    finally:
+        if writer is not None:
+            writer.close()
+
+def run_build_cache(args, out):
+    built = l2v.build_distance_cache(args.metric or None, force=args.force)
+    out.write("Distance cache in " + l2v.get_cache_dir() + " (rebuilt: " + (", ".join(built) or "none") + ")\n")
+
+def run_export(args, out):
+    from lang2vec import export
+    paths = []
+    if not args.no_distances:
+        paths += export.export_distances(args.output_dir, args.metric or None, condensed=args.condensed, block_size=args.block_size, processes=args.processes, force=args.force)
+    if args.sets:
+        paths.append(export.export_features(args.output_dir, args.sets, block_size=args.block_size, processes=args.processes, force=args.force))
+    out.write("".join( path + "\n" for path in paths ))
+
+def run_impute(args, out):
+    from lang2vec import impute
+    predictions = impute.impute_features(sources=args.source, features=args.features, metric=args.metric, k=args.k,
+                                         binary=not args.probabilities, weighted=args.weighted, processes=args.processes)
+    impute.save_predictions(args.output_file, predictions)
+    out.write(args.output_file + "\n")
+
+def run_serve(args, out):
+    from lang2vec import server
+    server.serve(host=args.host, port=args.port, window=args.window / 1000.0)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="lang2vec", description="Query the URIEL typological database and the lang2vec distances.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    features = subparsers.add_parser("features", help="feature vectors for a stream of language codes")
+    features.add_argument("--sets", required=True, help="feature set expression, e.g. syntax_knn+geo or syntax_wals|syntax_sswl")
+    features.set_defaults(run=run_features)
+
+    distance = subparsers.add_parser("distance", help="distances for a stream of language pairs (two codes per line)")
+    distance.add_argument("--metric", action="append", choices=l2v.DISTANCES, help="distance to output (repeat for several; default: genetic)")
+    distance.set_defaults(run=run_distance)
+
+    for subparser in (features, distance):
+        subparser.add_argument("inputs", nargs="*", help="input files (default: stdin)")
+        subparser.add_argument("--format", choices=["tsv", "npy"], default="tsv", help="output format (npy requires --output)")
+        subparser.add_argument("-o", "--output", help="output file (default: stdout)")
+        subparser.add_argument("--header", action="store_true", help="write a header line (tsv)")
+        subparser.add_argument("--chunk-size", type=int, default=10000, help="number of input lines processed at once")
+
+    build_cache = subparsers.add_parser("build-cache", help="unpack the distance matrices into the cache directory")
+    build_cache.add_argument("--metric", action="append", choices=l2v.DISTANCES, help="distance to unpack (default: all)")
+    build_cache.add_argument("--force", action="store_true", help="rebuild even if the cache is up to date")
+    build_cache.set_defaults(run=run_build_cache, output=None, format=None)
+
+    export = subparsers.add_parser("export", help="write the full distance matrices, and optionally the features of all languages, to .npy files")
+    export.add_argument("output_dir", help="output directory")
+    export.add_argument("--metric", action="append", choices=l2v.DISTANCES, help="distance to export (repeat for several; default: all)")
+    export.add_argument("--condensed", action="store_true", help="write only the upper triangle of the distance matrices")
+    export.add_argument("--sets", help="also export this feature set expression for all languages")
+    export.add_argument("--no-distances", action="store_true", help="export only the features")
+    export.add_argument("--processes", type=int, help="number of worker processes (default: one per core)")
+    export.add_argument("--block-size", type=int, default=512, help="number of rows per block")
+    export.add_argument("--force", action="store_true", help="start over instead of resuming or skipping finished files")
+    export.set_defaults(run=run_export, output=None, format=None)
+
+    impute = subparsers.add_parser("impute", help="predict the missing features from the nearest languages into a feature_predictions-style .npz")
+    impute.add_argument("output_file", help="output .npz file")
+    impute.add_argument("--source", action="append", help="source of the observed values, e.g. WALS (repeat for several; default: all)")
+    impute.add_argument("--features", help="feature set (e.g. syntax_wals) or feature name prefix (e.g. S_) to impute (default: all)")
+    impute.add_argument("--metric", default="features", help="one of the distances, or 'features' (default)")
+    impute.add_argument("-k", type=int, default=10, help="number of neighbours per feature")
+    impute.add_argument("--weighted", action="store_true", help="weight the neighbours by inverse distance")
+    impute.add_argument("--probabilities", action="store_true", help="keep the averages instead of thresholding at 0.5")
+    impute.add_argument("--processes", type=int, default=1, help="number of worker processes")
+    impute.set_defaults(run=run_impute, output=None, format=None)
+
+    serve = subparsers.add_parser("serve", help="run a local query server that keeps the databases loaded")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve.add_argument("--window", type=float, default=2.0, help="milliseconds during which concurrent requests are batched together")
+    serve.set_defaults(run=run_serve, output=None, format=None)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.format == "npy" and not args.output:
+        parser.error("--format npy requires --output")
+    out = sys.stdout
+    if args.output and args.format != "npy":
+        out = open(args.output, 'w')
+    try:
+        args.run(args, out)
+    except BrokenPipeError:
+        # e.g. piped into head
+        sys.stderr.close()
+        return 1
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
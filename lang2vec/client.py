@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import urllib.error, urllib.request
+import numpy as np
+
+'''
+Thin client for the lang2vec query server (lang2vec serve), with the same signatures as
+the functions of lang2vec.lang2vec.
+
+    >>> from lang2vec.client import Client
+    >>> l2v = Client()
+    >>> l2v.get_features("eng fra", "syntax_wals")["fra"][:3]
+    >>> l2v.distance("syntactic", "eng", "fra")
+'''
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+class Client(object):
+    def __init__(self, url=DEFAULT_URL, timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8"))["error"]
+            except (ValueError, KeyError):
+                message = str(e)
+            raise Exception(message)
+
+    def get_features(self, languages, feature_set_inp, header=False, minimal=False):
+        if isinstance(languages, str):
+            languages = languages.split()
+        return self._request("/features", {"languages": languages, "feature_set": feature_set_inp, "header": header, "minimal": minimal})
+
+    def distance(self, distance, *args):
+        if len(args) == 1 and isinstance(args[0], list):
+            langs = args[0]
+        else:
+            langs = list(args)
+        result = self._request("/distance", {"distance": distance, "languages": langs})
+        if len(langs) == 2:
+            return result
+        if isinstance(distance, str):
+            return np.array(result)
+        return [ np.array(arr) for arr in result ]
+
+    def available_languages(self):
+        return set(self._request("/languages"))
+
+    def available_uriel_languages(self):
+        return set(self._request("/uriel_languages"))
+
+    def available_learned_languages(self):
+        return set(self._request("/learned_languages"))
+
+    def available_distance_languages(self):
+        return self._request("/distance_languages")
+
+    def available_feature_sets(self):
+        return self._request("/feature_sets")
+
+    def stats(self):
+        return self._request("/stats")
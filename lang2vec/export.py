@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os, shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from lang2vec import lang2vec as l2v
+
+'''
+Export of the full all-pairs distance matrices (and optionally of the feature vectors of
+all languages) to .npy files. The output is split into blocks of rows which are filled in
+parallel by a pool of processes; the workers memory-map both the cached sparse distance
+matrices and the output file. A marker file is written for every finished block, so an
+interrupted export picks up where it stopped when run again.
+
+    >>> from lang2vec import export
+    >>> export.export_distances("out", ["genetic", "syntactic"], processes=8)
+    >>> export.export_features("out", "syntax_knn+geo")
+'''
+
+EXPORT_BLOCK_SIZE = 512
+
+def _marker_dir(path):
+    return os.path.join(os.path.dirname(path), ".blocks", os.path.basename(path))
+
+def _marker_path(path, start, end):
+    return os.path.join(_marker_dir(path), str(start) + "-" + str(end))
+
+def _open_output(path, shape, dtype, force=False):
+    # Returns the blocks already done, or None if the file is complete. The marker
+    # directory is created before the output, and removed once every block is done.
+    markers = _marker_dir(path)
+    if not force and os.path.isdir(markers) and os.path.exists(path):
+        out = np.load(path, mmap_mode='r')
+        if out.shape == shape and out.dtype == dtype:
+            return set(os.listdir(markers))
+    elif not force and os.path.exists(path):
+        return None
+    shutil.rmtree(markers, ignore_errors=True)
+    os.makedirs(markers)
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    del out
+    return set()
+
+def _finish_output(path):
+    shutil.rmtree(_marker_dir(path), ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(_marker_dir(path)))
+    except OSError:
+        pass
+
+def _run_blocks(function, tasks, processes):
+    if processes == 1 or len(tasks) <= 1:
+        for task in tasks:
+            function(*task)
+        return
+    with ProcessPoolExecutor(max_workers=processes, initializer=l2v._apply_data_settings, initargs=(l2v._data_settings(),)) as pool:
+        for result in [ pool.submit(function, *task) for task in tasks ]:
+            result.result()
+
+def _distance_block(distance, path, start, end, condensed):
+    data = l2v.load_distance_matrix(distance)
+    N = data.shape[0]
+    # rows start:end of the full symmetric matrix: the upper triangle is read from the
+    # rows, the lower triangle from the columns of the upper triangular matrix
+    rows = data[start:end].toarray().astype(np.float64)
+    row_ids = np.arange(start, end)[:, None]
+    rows[row_ids >= np.arange(N)[None, :]] = 0.0
+    if condensed:
+        out = np.load(path, mmap_mode='r+')
+        offset = start * N - start * (start + 1) // 2
+        for i in range(start, end):
+            out[offset:offset + N - 1 - i] = rows[i - start, i + 1:]
+            offset += N - 1 - i
+    else:
+        lower = data[:end, start:end].toarray().T
+        lower[row_ids <= np.arange(end)[None, :]] = 0.0
+        rows[:, :end] += lower
+        out = np.load(path, mmap_mode='r+')
+        out[start:end] = rows
+    out.flush()
+    del out
+    open(_marker_path(path, start, end), 'w').close()
+
+def export_distances(output_dir, distances=None, condensed=False, block_size=EXPORT_BLOCK_SIZE, processes=None, force=False):
+    # one <distance>.npy (N x N, or the N*(N-1)/2 upper triangle if condensed) per
+    # distance, with the languages of the rows in distance_languages.txt
+    if distances is None:
+        distances = l2v.DISTANCES
+    elif isinstance(distances, str):
+        distances = [distances]
+    for dist in distances:
+        if dist not in l2v.DISTANCES:
+            raise Exception("Unknown distance " + dist + ". The available ones are: " + ' '.join(l2v.DISTANCES))
+    os.makedirs(output_dir, exist_ok=True)
+    # unpack the matrices once, before the workers memory-map them
+    l2v.build_distance_cache(distances)
+    languages = l2v.get_constant("DISTANCE_LANGUAGES")
+    with open(os.path.join(output_dir, "distance_languages.txt"), 'w') as out:
+        out.write("\n".join(languages) + "\n")
+    paths = []
+    for dist in distances:
+        data = l2v.load_distance_matrix(dist)
+        N = data.shape[0]
+        path = os.path.join(output_dir, dist + (".condensed" if condensed else "") + ".npy")
+        shape = (N * (N - 1) // 2,) if condensed else (N, N)
+        done = _open_output(path, shape, data.dtype, force=force)
+        if done is not None:
+            tasks = [ (dist, path, start, min(start + block_size, N), condensed) for start in range(0, N, block_size)
+                      if str(start) + "-" + str(min(start + block_size, N)) not in done ]
+            _run_blocks(_distance_block, tasks, processes)
+            _finish_output(path)
+        paths.append(path)
+    return paths
+
+def _features_block(feature_set, languages, path, start, end):
+    values = l2v.get_features(languages, feature_set, output="array", dtype=np.float32, missing="nan").values
+    out = np.load(path, mmap_mode='r+')
+    out[start:end] = values
+    out.flush()
+    del out
+    open(_marker_path(path, start, end), 'w').close()
+
+def export_features(output_dir, feature_set_inp, languages=None, name="features", block_size=EXPORT_BLOCK_SIZE, processes=None, force=False):
+    # <name>.npy (float32, NaN for missing values) with the languages of the rows in
+    # <name>_languages.txt and the feature names in <name>_features.txt
+    if languages is None:
+        languages = sorted(l2v.get_constant("LANGUAGES"))
+    elif isinstance(languages, str):
+        languages = languages.split()
+    os.makedirs(output_dir, exist_ok=True)
+    plan = l2v.compile_feature_sets(feature_set_inp)
+    feature_names = [ f.replace(" ", "_") for f in plan.feature_names ]
+    with open(os.path.join(output_dir, name + "_languages.txt"), 'w') as out:
+        out.write("\n".join(languages) + "\n")
+    with open(os.path.join(output_dir, name + "_features.txt"), 'w') as out:
+        out.write("\n".join(feature_names) + "\n")
+    path = os.path.join(output_dir, name + ".npy")
+    done = _open_output(path, (len(languages), len(feature_names)), np.dtype(np.float32), force=force)
+    if done is not None:
+        N = len(languages)
+        tasks = [ (feature_set_inp, languages[start:start + block_size], path, start, min(start + block_size, N)) for start in range(0, N, block_size)
+                  if str(start) + "-" + str(min(start + block_size, N)) not in done ]
+        _run_blocks(_features_block, tasks, processes)
+        _finish_output(path)
+    return path
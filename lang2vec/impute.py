@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from lang2vec import lang2vec as l2v
+
+'''
+Prediction of the missing (-1) typological features of every language from its k nearest
+languages, as in the *_knn feature sets. The observed value of a feature is the average
+over the selected sources of features.npz (e.g. only WALS), and a missing value is the
+(optionally distance-weighted) average of the k nearest languages for which the feature
+is observed. Distances are either one of lang2vec.DISTANCES (precomputed) or "features",
+the mean squared difference over the features two languages share.
+
+    >>> from lang2vec import impute
+    >>> predictions = impute.impute_features(sources=["WALS"], metric="genetic", k=10)
+    >>> impute.save_predictions("feature_predictions_wals.npz", predictions)
+'''
+
+IMPUTE_METRICS = l2v.DISTANCES + ["features"]
+IMPUTE_CHUNK_SIZE = 256
+# nearest languages considered for each language, per feature only the first k that
+# have a value are used
+IMPUTE_CANDIDATES = 200
+MIN_OVERLAP = 5
+
+def load_observed(sources=None, features=None):
+    # (langs, feats, values): the average of every feature over the selected sources,
+    # -1 where none of them has a value. features is a feature set name (whose source
+    # is used when sources is None), a feature name prefix or a list of feature names.
+    feature_database = l2v.load_database("features.npz")
+    if isinstance(features, str) and features in l2v.FEATURE_SETS_DICT:
+        filename, source, prefix = l2v.FEATURE_SETS_DICT[features]
+        if filename != "features.npz":
+            raise Exception("ERROR: Only the feature sets of features.npz can be imputed, not " + features + ".")
+        if sources is None:
+            sources = [source]
+        features = prefix
+    if features is None:
+        feature_indices = np.arange(len(feature_database["feats"]))
+    elif isinstance(features, str):
+        feature_indices = l2v.get_prefix_index(features, feature_database)
+    else:
+        unknown = [ f for f in features if f not in feature_database["feat_index"] ]
+        if unknown:
+            raise Exception("ERROR: Unknown features " + " ".join(unknown))
+        feature_indices = np.array([ l2v.get_feature_index(f, feature_database) for f in features ], dtype=np.intp)
+    if len(feature_indices) == 0:
+        raise Exception("ERROR: No features match " + str(features))
+    all_sources = feature_database["sources"].tolist()
+    if sources is None:
+        source_indices = np.arange(len(all_sources))
+    else:
+        if isinstance(sources, str):
+            sources = [sources]
+        unknown = [ s for s in sources if s not in all_sources ]
+        if unknown:
+            raise Exception("ERROR: Unknown sources " + " ".join(unknown) + ". The available ones are: " + " ".join(all_sources))
+        source_indices = np.array([ all_sources.index(s) for s in sources ], dtype=np.intp)
+    data = feature_database["data"][:, feature_indices][:, :, source_indices]
+    present = data != -1
+    counts = present.sum(axis=2)
+    values = np.where(present, data, 0).sum(axis=2) / np.maximum(counts, 1)
+    values[counts == 0] = -1
+    return feature_database["langs"].tolist(), feature_database["feats"][feature_indices].tolist(), values.astype(np.float32)
+
+def feature_distances(values, present, rows, min_overlap=MIN_OVERLAP):
+    # mean squared difference between the languages `rows` and all languages over the
+    # features both have, as matrix products; inf when they share fewer than min_overlap
+    present = present.astype(np.float32)
+    values = np.where(present > 0, values, 0).astype(np.float32)
+    squares = values * values
+    shared = present[rows] @ present.T
+    differences = squares[rows] @ present.T + present[rows] @ squares.T - 2 * (values[rows] @ values.T)
+    distances = np.maximum(differences, 0) / np.maximum(shared, 1)
+    distances[shared < max(min_overlap, 1)] = np.inf
+    return distances
+
+def metric_distances(metric, langs, rows, columns=None):
+    # precomputed distances between the languages `rows` and all languages, inf for
+    # the languages without precomputed distances
+    data = l2v.load_distance_matrix(metric)
+    if columns is None:
+        columns = data.tocsc()
+    distance_language_index = l2v.get_constant("DISTANCE_LANGUAGE_INDEX")
+    indices = np.array([ distance_language_index.get(l, -1) for l in langs ], dtype=np.intp)
+    row_indices = indices[rows]
+    full_rows = l2v._distance_rows(data, columns, np.maximum(row_indices, 0))
+    distances = full_rows[:, np.maximum(indices, 0)]
+    distances[:, indices == -1] = np.inf
+    distances[row_indices == -1] = np.inf
+    return distances
+
+def knn_predict(distances, values, present, prior, k=10, candidates=IMPUTE_CANDIDATES, weighted=False):
+    # per row of distances and per feature, the average value of the k nearest languages
+    # that have the feature; the prior where none of the candidates has it
+    num_candidates = min(candidates, distances.shape[1])
+    nearest = np.argpartition(distances, num_candidates - 1, axis=1)[:, :num_candidates]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+    order = np.argsort(nearest_distances, axis=1, kind="stable")
+    nearest = np.take_along_axis(nearest, order, axis=1)
+    nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+    if weighted:
+        weights = 1.0 / (nearest_distances + 1e-6)
+    else:
+        weights = np.ones(nearest_distances.shape)
+    weights[~np.isfinite(nearest_distances)] = 0
+    # one candidate rank at a time for all rows and features, so that only (rows, features)
+    # arrays are allocated
+    shape = (len(distances), values.shape[1])
+    counts = np.zeros(shape, dtype=np.int32)
+    total = np.zeros(shape)
+    weighted_sum = np.zeros(shape)
+    for m in range(num_candidates):
+        neighbors = nearest[:, m]
+        used = present[neighbors] & (counts < k) & (weights[:, m, None] > 0)
+        counts += used
+        used_weights = used * weights[:, m, None]
+        total += used_weights
+        weighted_sum += used_weights * values[neighbors]
+        if counts.min() >= k:
+            break
+    predictions = weighted_sum / np.maximum(total, 1e-12)
+    return np.where(total > 0, predictions, prior[None, :])
+
+_WORKER_STATE = {}
+
+def _init_worker(state, settings):
+    l2v._apply_data_settings(settings)
+    _WORKER_STATE.update(state)
+
+def _impute_chunk(rows):
+    state = _WORKER_STATE
+    values, present, metric = state["values"], state["present"], state["metric"]
+    if metric == "features":
+        distances = feature_distances(values, present, rows, state["min_overlap"])
+    else:
+        if "columns" not in state:
+            state["columns"] = l2v.load_distance_matrix(metric).tocsc()
+        distances = metric_distances(metric, state["langs"], rows, state["columns"])
+    distances[np.arange(len(rows)), rows] = np.inf
+    return knn_predict(distances, values, present, state["prior"], k=state["k"], candidates=state["candidates"], weighted=state["weighted"])
+
+def impute_features(sources=None, features=None, metric="features", k=10, binary=True, weighted=False,
+                    candidates=IMPUTE_CANDIDATES, min_overlap=MIN_OVERLAP, chunk_size=IMPUTE_CHUNK_SIZE, processes=1):
+    # a feature database like feature_predictions.npz: the observed values (averaged over
+    # the selected sources) with the missing ones predicted, thresholded at 0.5 if binary
+    if metric not in IMPUTE_METRICS:
+        raise Exception("Unknown metric " + str(metric) + ". The available ones are: " + ' '.join(IMPUTE_METRICS))
+    langs, feats, values = load_observed(sources, features)
+    present = values != -1
+    # the average over the languages that have the feature, for the languages without
+    # any usable neighbour
+    prior = np.where(present, values, 0).sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+    state = {"langs": langs, "values": values, "present": present, "prior": prior, "metric": metric, "k": k,
+             "candidates": candidates, "min_overlap": min_overlap, "weighted": weighted}
+    if metric != "features":
+        l2v.build_distance_cache([metric])
+
+    rows = np.nonzero(~present.all(axis=1))[0]
+    chunks = [ rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size) ]
+    result = values.copy()
+    if processes == 1 or len(chunks) <= 1:
+        _WORKER_STATE.clear()
+        _init_worker(state, {})
+        try:
+            predictions = [ _impute_chunk(chunk) for chunk in chunks ]
+        finally:
+            _WORKER_STATE.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(state, l2v._data_settings())) as pool:
+            predictions = list(pool.map(_impute_chunk, chunks))
+    for chunk, predicted in zip(chunks, predictions):
+        result[chunk] = np.where(present[chunk], values[chunk], predicted)
+    if binary:
+        result = (result >= 0.5).astype(np.float32)
+    return {"langs": np.array(langs), "feats": np.array(feats), "sources": np.array(["predicted"]), "data": result[:, :, None]}
+
+def save_predictions(path, predictions):
+    # same layout as feature_predictions.npz
+    np.savez_compressed(path, langs=predictions["langs"], feats=predictions["feats"], sources=predictions["sources"], data=predictions["data"])
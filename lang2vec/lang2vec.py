@@ -3,12 +3,11 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import json, itertools, os, sys
+import hashlib, json, logging, os, re, sys, threading, shutil, tempfile, time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 import numpy as np
-import pkg_resources
 from zipfile import ZipFile as zf
-import urllib.request
-import scipy.sparse as sparse
 
 ''' 
 Turning the convenience script into a library, for accessing the values inside the URIEL typological and geodata knowledge bases 
@@ -18,7 +17,14 @@ Original Author: Patrick Littell
 Last modified: March 25, 2019
 '''
 
-LETTER_CODES_FILE = pkg_resources.resource_filename(__name__, "data/letter_codes.json")
+# Notes about languages that are missing from a feature set are logged here (and shown
+# on stderr if logging is not configured).
+logger = logging.getLogger(__name__)
+
+# Nothing is read from the data directory at import time: the module constants below
+# (LANGUAGES, URIEL_LANGUAGES, DISTANCE_LANGUAGES, ...) are computed on first access.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+LETTER_CODES_FILE = os.path.join(DATA_DIR, "letter_codes.json")
 FEATURE_SETS_DICT = {
     
     "syntax_wals" : ( "features.npz", "WALS", "S_" ),
@@ -46,11 +52,203 @@ FEATURE_SETS_DICT = {
     "learned" : ( "learned.npy", "learned", "LEARNED_")
     
 }
-DISTANCES_FILE = pkg_resources.resource_filename(__name__, "data/distances2.zip")
-DISTANCES_LANGUAGE_FILE = pkg_resources.resource_filename(__name__, "data/distances_languages.txt")
+DISTANCES_FILE = os.path.join(DATA_DIR, "distances2.zip")
+DISTANCES_LANGUAGE_FILE = os.path.join(DATA_DIR, "distances_languages.txt")
+
+# Opt-in instrumentation of the hot paths. While a profile is active, or a callback is
+# set, the time spent in each stage and a few counters (files and bytes loaded, cache
+# hits and misses, languages resolved, matrix sizes) are recorded. Otherwise the
+# instrumentation points only check a flag.
+_PROFILING = False
+_PROFILES = []
+_PROFILE_CALLBACK = None
+_PROFILE_LOCK = threading.Lock()
+
+class Profile(object):
+    def __init__(self):
+        self.timings = OrderedDict()
+        self.calls = OrderedDict()
+        self.counters = OrderedDict()
+
+    def add(self, kind, name, value):
+        if kind == "time":
+            self.timings[name] = self.timings.get(name, 0.0) + value
+            self.calls[name] = self.calls.get(name, 0) + 1
+        else:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        lines = [ "%-40s %8d calls %12.6fs" % (name, self.calls[name], seconds) for name, seconds in self.timings.items() ]
+        lines += [ "%-40s %12d" % (name, value) for name, value in self.counters.items() ]
+        return "\n".join(lines)
+
+def _update_profiling():
+    global _PROFILING
+    _PROFILING = bool(_PROFILES) or _PROFILE_CALLBACK is not None
+
+@contextmanager
+def profile():
+    # with lang2vec.profile() as p: ...; print(p.summary())
+    # profiles are process-wide: calls made from other threads are recorded too
+    p = Profile()
+    with _PROFILE_LOCK:
+        _PROFILES.append(p)
+        _update_profiling()
+    try:
+        yield p
+    finally:
+        with _PROFILE_LOCK:
+            _PROFILES.remove(p)
+            _update_profiling()
+
+def set_profile_callback(callback):
+    # callback(kind, name, value) is called for every event, with kind "time" (value in
+    # seconds) or "count"; None removes it
+    global _PROFILE_CALLBACK
+    with _PROFILE_LOCK:
+        _PROFILE_CALLBACK = callback
+        _update_profiling()
+
+def _profile_event(kind, name, value):
+    with _PROFILE_LOCK:
+        for p in _PROFILES:
+            p.add(kind, name, value)
+        callback = _PROFILE_CALLBACK
+    if callback is not None:
+        callback(kind, name, value)
+
+def _profile_start():
+    return time.perf_counter() if _PROFILING else None
+
+def _profile_stage(stage, start):
+    # records the time since start, and returns the start of the next stage
+    if start is None:
+        return _profile_start()
+    now = time.perf_counter()
+    _profile_event("time", stage, now - start)
+    return now
+
+def _profile_count(name, value=1):
+    _profile_event("count", name, value)
+
+# Process-wide registry of the loaded databases. Every member of a database is read
+# (and decompressed) once and kept as a plain array, so that repeated queries only
+# pay for the indexing. The least recently used databases are evicted first.
+DATABASE_CACHE_SIZE = 8
+_DATABASE_CACHE = OrderedDict()
+_DATABASE_LOCK = threading.RLock()
+_IN_FLIGHT = {}
+
+def _load_once(key, lookup, load):
+    # lookup() returns the cached value or None; load() computes and caches it. The lock
+    # is only held for the lookups, so that different files load in parallel, while
+    # concurrent callers for the same key wait for the first one instead of loading it
+    # again.
+    while True:
+        with _DATABASE_LOCK:
+            value = lookup()
+            if value is not None:
+                return value
+            event = _IN_FLIGHT.get(key)
+            if event is None:
+                event = _IN_FLIGHT[key] = threading.Event()
+                break
+        event.wait()
+    try:
+        return load()
+    finally:
+        with _DATABASE_LOCK:
+            del _IN_FLIGHT[key]
+        event.set()
+
+def get_database_path(filename):
+    return os.path.join(DATA_DIR, filename)
+
+# The data paths, which may have been changed after the import, are passed on to worker
+# processes with these.
+_DATA_SETTINGS = ("DATA_DIR", "LETTER_CODES_FILE", "DISTANCES_FILE", "DISTANCES_LANGUAGE_FILE")
+
+def _data_settings():
+    return { name: globals()[name] for name in _DATA_SETTINGS }
 
-with open(LETTER_CODES_FILE, 'r') as letter_file:
-    LETTER_CODES = json.load(letter_file)
+def _apply_data_settings(settings):
+    globals().update(settings)
+
+def read_database(path):
+    if path.endswith(".npy"):
+        return read_learned_database(path)
+    feature_database = {}
+    with np.load(path) as npz:
+        for key in npz.files:
+            feature_database[key] = npz[key]
+            # the arrays are shared between callers
+            feature_database[key].flags.writeable = False
+    index_database(feature_database)
+    return feature_database
+
+def index_database(feature_database):
+    # code -> row and feature name -> column lookups, so that resolving a batch of
+    # languages or a feature set does not scan the whole "langs"/"feats" arrays
+    lang_index = { l: i for i, l in enumerate(feature_database["langs"].tolist()) }
+    for letter_code, lang_code in get_constant("LETTER_CODES").items():
+        if lang_code in lang_index and letter_code not in lang_index:
+            lang_index[letter_code] = lang_index[lang_code]
+    feature_database["lang_index"] = lang_index
+    feature_names = feature_database["feats"].tolist()
+    feature_database["feat_index"] = { f: i for i, f in enumerate(feature_names) }
+    prefix_index = {}
+    for filename, source, prefix in FEATURE_SETS_DICT.values():
+        if prefix not in prefix_index:
+            prefix_index[prefix] = np.array([ i for i, f in enumerate(feature_names) if f.startswith(prefix) ], dtype=np.intp)
+    feature_database["prefix_index"] = prefix_index
+
+def load_database(filename):
+    path = get_database_path(filename)
+    with _DATABASE_LOCK:
+        if path in _DATABASE_CACHE:
+            _DATABASE_CACHE.move_to_end(path)
+            if _PROFILING:
+                _profile_count("database_cache_hits")
+            return _DATABASE_CACHE[path]
+    return _load_once(("database", path), lambda: _DATABASE_CACHE.get(path), lambda: _read_and_cache_database(path))
+
+def _read_and_cache_database(path):
+    start = _profile_start()
+    feature_database = read_database(path)
+    if _PROFILING:
+        _profile_stage("load_database", start)
+        _profile_count("database_cache_misses")
+        _profile_count("files_loaded")
+        _profile_count("bytes_loaded", sum(v.nbytes for v in feature_database.values() if isinstance(v, np.ndarray)))
+    with _DATABASE_LOCK:
+        _DATABASE_CACHE[path] = feature_database
+        _evict_databases()
+    return feature_database
+
+def _evict_databases():
+    if DATABASE_CACHE_SIZE is None:
+        return
+    while len(_DATABASE_CACHE) > max(DATABASE_CACHE_SIZE, 0):
+        _DATABASE_CACHE.popitem(last=False)
+
+def set_cache_size(size):
+    # None means unbounded, 0 disables caching
+    global DATABASE_CACHE_SIZE
+    with _DATABASE_LOCK:
+        DATABASE_CACHE_SIZE = size
+        _evict_databases()
+
+def cache_info():
+    with _DATABASE_LOCK:
+        return {"size": len(_DATABASE_CACHE), "max_size": DATABASE_CACHE_SIZE,
+                "files": [os.path.basename(path) for path in _DATABASE_CACHE]}
+
+def clear_cache():
+    with _DATABASE_LOCK:
+        _DATABASE_CACHE.clear()
+        _DISTANCE_CACHE.clear()
+        _NEIGHBOR_CACHE.clear()
+        _PLAN_CACHE.clear()
 
 LEARNED_LETTER_CODES = {'nhy', 'wbp', 'dgc', 'aia', 'aim', 'aii', 'ztq', 'blw', 'dgr', 'blz', 'xav', 'dgz', 'kjh', 'mco', 'lhu', 'xnn', 'kjb', 'kje', 'lom', 'dhg', 'ibo', 'lhi', 'iba', 'zty', 'lac', 'tgp', 'rmy', 'lam', 'mxb', 'laj', 'ctu', 'lav', 'rmc', 'lat', 'rme', 'mxq', 'lug', 'cta', 'mxt', 'rmo', 'rmn', 'pag', 'kmu', 'ngp', 'ngu', 'kms', 'kmm', 'kmo', 'kmh', 'pwg', 'kmk', 'ngc', 'tha', 'tih', 'msc', 'plt', 'plu', 'bqc', 'plw', 'kxw', 'hla', 'ary', 'cjo', 'bqj', 'arb', 'nph', 'npo', 'npl', 'cjv', 'arn', 'arl', 'nya', 'qub', 'ksf', 'mjw', 'tmd', 'snd', 'nyn', 'ksr', 'kss', 'ksp', 'pes', 'cuc', 'mjc', 'ese', 'jam', 'wbm', 'maa', 'maf', 'sxb', 'mhx', 'maj', 'huv', 'huu', 'yua', 'hus', 'jac', 'mam', 'cme', 'maq', 'mav', 'mau', 'maz', 'jav', 'hub', 'yut', 'dhm', 'esk', 'omw', 'tur', 'bgs', 'tui', 'tuo', 'qul', 'tuc', 'quh', 'lww', 'tuf', 'tue', 'guo', 'aeu', 'wmt', 'aey', 'aeb', 'tbk', 'bhl', 'shn', 'tbo', 'tbl', 'bhg', 'wmw', 'tbg', 'sbl', 'rim', 'wiu', 'ziw', 'nbc', 'tke', 'nbe', 'slv', 'ria', 'knj', 'sba', 'ind', 'tku', 'inb', 'wib', 'sue', 'ino', 'wim', 'gbr', 'rkb', 'sgb', 'leu', 'kac', 'gur', 'due', 'leg', 'ium', 'dur', 'leh', 'sgz', 'kjs', 'msk', 'msm', 'msa', 'msb', 'snf', 'sna', 'hch', 'snc', 'tlf', 'sny', 'cco', 'nko', 'myw', 'snp', 'etu', 'krj', 'ntp', 'suk', 'cnt', 'mna', 'sua', 'suc', 'cnl', 'mpp', 'cni', 'cnh', 'suz', 'mse', 'fra', 'naf', 'sus', 'bzd', 'tpa', 'pap', 'qxo', 'qxn', 'bzh', 'qxh', 'bzj', 'njb', 'tpp', 'pab', 'jiv', 'tpt', 'kwi', 'gud', 'tpz', 'pah', 'pao', 'ong', 'qwh', 'ann', 'bci', 'bch', 'gnw', 'bcl', 'fuq', 'meq', 'guh', 'gnb', 'lai', 'gng', 'lol', 'anv', 'med', 'mee', 'dow', 'gid', 'zpo', 'zpl', 'zpm', 'eus', 'zpi', 'yby', 'ign', 'zpz', 'zpv', 'zpt', 'zpu', 'ons', 'giz', 'zpq', 'myk', 'ycn', 'cux', 'qxr', 'myb', 'for', 'mya', 'cul', 'myy', 'fon', 'cuk', 'klt', 'hwc', 'cub', 'myu', 'kbq', 'kbp', 'atg', 'rup', 'rus', 'urd', 'urb', 'ura', 'kbc', 'ton', 'toi', 'tgk', 'toj', 'kbh', 'fub', 'kbm', 'nfa', 'toc', 'tob', 'poy', 'iqw', 'bth', 'rro', 'nog', 'mpt', 'mpx', 'ken', 'por', 'yuj', 'pot', 'dyi', 'kek', 'poi', 'poh', 'btx', 'kew', 'loz', 'pol', 'nou', 'not', 'mph', 'awb', 'poe', 'kwd', 'hop', 'enx', 'hot', 'srq', 'srp', 'njz', 'sri', 'ixl', 'mww', 'srm', 'cgc', 'wuv', 'srn', 'yom', 'udu', 'urt', 'mbd', 'mbc', 'mbb', 'mbl', 'mbj', 'yva', 'mbh', 'amr', 'mbt', 'mbs', 'kmr', 'syb', 'hto', 'zaa', 'ukr', 'ttq', 'ivb', 'ojb', 'tte', 'ttc', 'crh', 'nmf', 'crm', 'boa', 'crn', 'bon', 'bom', 'boj', 'crx', 'aji', 'crs', 'crt', 'box', 'nak', 'kki', 'loq', 'aak', 'aai', 'kkc', 'nab', 'icr', 'dob', 'gub', 'guc', 'aaz', 'ood', 'jvn', 'naq', 'gui', 'nas', 'aau', 'gul', 'gum', 'gun', 'nav', 'ata', 'atb', 'pam', 'njm', 'njn', 'pri', 'prf', 'ivv', 'yor', 'zav', 'zas', 'zar', 'zam', 'zao', 'pls', 'zai', 'att', 'yon', 'zae', 'zad', 'sda', 'dtp', 'prs', 'zac', 'zab', 'mto', 'som', 'mti', 'xog', 'hbo', 'mta', 'des', 'uvl', 'sot', 'mtp', 'sop', 'soq', 'ckb', 'kyq', 'kyu', 'tyv', 'kyz', 'nst', 'nss', 'wnc', 'nso', 'nsn', 'asg', 'bpr', 'bps', 'kyf', 'kyg', 'nse', 'aso', 'ifu', 'nsa', 'kpg', 'kpf', 'mks', 'tso', 'tsn', 'eka', 'pdt', 'kpj', 'tsg', 'kpw', 'cax', 'tsz', 'mkd', 'kpr', 'pdc', 'mkl', 'mkn', 'kpx', 'xuo', 'bbj', 'dah', 'aoj', 'plg', 'bba', 'daa', 'zpc', 'nop', 'gof', 'mfe', 'mfk', 'txq', 'mua', 'txu', 'bbr', 'qvn', 'mos', 'zsr', 'gvl', 'hye', 'gvn', 'wnu', 'gvc', 'gvf', 'djr', 'bkq', 'afr', 'ksc', 'taw', 'tav', 'fai', 'tat', 'lcm', 'taq', 'tam', 'mek', 'taj', 'bkd', 'xla', 'tac', 'iou', 'gqr', 'kog', 'cak', 'cym', 'cya', 'snn', 'zat', 'mqy', 'kor', 'nep', 'zho', 'shu', 'nng', 'apy', 'nnb', 'apz', 'apu', 'apt', 'apw', 'nno', 'nnh', 'apr', 'mqb', 'adi', 'apn', 'nnp', 'yka', 'ape', 'tfr', 'kze', 'cpu', 'pne', 'hns', 'nwi', 'adj', 'ssw', 'wrk', 'cut', 'nwx', 'mhl', 'wrs', 'hne', 'hnj', 'ajz', 'mxp', 'ssg', 'ssd', 'gdn', 'ots', 'khy', 'otq', 'gdg', 'cot', 'fuv', 'cor', 'moc', 'con', 'ote', 'mox', 'fuh', 'cof', 'otn', 'otm', 'coe', 'mop', 'gdr', 'ncj', 'nxd', 'ktu', 'beq', 'tew', 'twi', 'mps', 'bem', 'bel', 'ben', 'ktj', 'tet', 'kto', 'dad', 'ktm', 'bef', 'csk', 'fij', 'cso', 'eza', 'fin', 'bnp', 'tsw', 'deu', 'xon', 'obo', 'csy', 'akh', 'nca', 'ake', 'niy', 'ded', 'khm', 'teo', 'rop', 'zos', 'tee', 'ted', 'zom', 'ilb', 'khz', 'grc', 'abt', 'ter', 'aby', 'abx', 'khs', 'ilo', 'byx', 'lmk', 'ike', 'sab', 'mai', 'yle', 'mzh', 'caf', 'shp', 'mza', 'ikk', 'lgm', 'kix', 'ikw', 'sat', 'mzz', 'roo', 'ron', 'xho', 'vie', 'vid', 'niq', 'usa', 'dww', 'ayr', 'hun', 'dwr', 'heg', 'tnp', 'tnn', 'tnk', 'tgl', 'nif', 'nii', 'kck', 'byr', 'tnc', 'nin', 'chf', 'che', 'chd', 'xtd', 'dan', 'bss', 'bsp', 'xtm', 'xtn', 'top', 'oym', 'tos', 'nrf', 'bsc', 'nri', 'ruf', 'chz', 'ell', 'bsn', 'mlp', 'kqp', 'trc', 'kqs', 'too', 'opm', 'kqw', 'mlg', 'swe', 'trp', 'kqc', 'mfy', 'swh', 'ppo', 'mcp', 'mcq', 'alb', 'ald', 'aom', 'mck', 'bbb', 'mcn', 'tod', 'alq', 'mca', 'mcb', 'mcd', 'mcf', 'okv', 'qup', 'khk', 'est', 'esu', 'quy', 'lus', 'quc', 'yim', 'quf', 'qug', 'mqj', 'soy', 'esi', 'bao', 'ban', 'gkp', 'kwj', 'lbb', 'awx', 'bjv', 'cwe', 'dis', 'pad', 'bjr', 'nob', 'lbj', 'lbk', 'sbe', 'noa', 'qvm', 'cag', 'yrb', 'dik', 'alp', 'tif', 'nde', 'yaq', 'ndo', 'tim', 'ndj', 'klv', 'ndi', 'yad', 'yre', 'yaa', 'yan', 'yao', 'yal', 'yam', 'tiy', 'upv', 'auc', 'nmo', 'iws', 'sey', 'gyr', 'kgf', 'aui', 'nma', 'usp', 'ses', 'mzl', 'seh', 'gya', 'gym', 'auy', 'vmy', 'kgp', 'cap', 'caq', 'car', 'kaq', 'cat', 'cav', 'slk', 'tzj', 'bjp', 'hau', 'sll', 'caa', 'cab', 'cac', 'gmv', 'mux', 'muy', 'wed', 'tna', 'hag', 'cao', 'geb', 'mpg', 'clu', 'ubu', 'ubr', 'atd', 'djk', 'rai', 'cle', 'xpe', 'kup', 'uig', 'mpm', 'tvk', 'kud', 'kue', 'bdh', 'kua', 'epo', 'kum', 'bdd', 'wer', 'bmh', 'bmk', 'ctd', 'yss', 'pis', 'gle', 'bmr', 'bmu', 'zaw', 'gla', 'mgc', 'cbi', 'zul', 'agm', 'agn', 'ian', 'vut', 'lit', 'agd', 'agg', 'gwi', 'mwm', 'lif', 'agr', 'lid', 'agt', 'agu', 'xbi', 'chq', 'ewe', 'azb', 'azg', 'yml', 'faa', 'azz', 'tbc', 'ptp', 'kqe', 'ptu', 'fao', 'nhr', 'sim', 'nhu', 'isd', 'ffm', 'nhx', 'cbr', 'cbu', 'cbt', 'cbv', 'rwo', 'vap', 'cbk', 'var', 'nhg', 'nhd', 'nhe', 'mwp', 'cbc', 'nhi', 'nho', 'kne', 'ebk', 'pmx', 'xsi', 'tcc', 'ceb', 'mrg', 'bvr', 'knf', 'mri', 'ces', 'miz', 'nvm', 'jic', 'pfe', 'mir', 'izz', 'miq', 'sps', 'mit', 'spp', 'mih', 'spl', 'mio', 'mil', 'mib', 'mic', 'sag', 'agw', 'mig', 'spa', 'mie', 'hrv', 'amk', 'amh', 'amn', 'amm', 'nbl', 'gaw', 'ame', 'gam', 'gah', 'hra', 'lsi', 'amp', 'amu', 'qvw', 'hix', 'qvs', 'waj', 'etr', 'qvz', 'ifa', 'ghs', 'qve', 'knv', 'qvc', 'ify', 'wat', 'zia', 'tzh', 'xed', 'wap', 'tzo', 'qvi', 'qvh', 'pma', 'rad', 'biu', 'tcs', 'adz', 'cpc', 'cpb', 'cpa', 'mbi', 'cpy', 'rar', 'tca', 'big', 'lmp', 'adl', 'kia', 'acf', 'ncl', 'aca', 'nch', 'acn', 'kik', 'ach', 'kin', 'mlh', 'jpn', 'acu', 'kqf', 'acr', 'whk', 'gso', 'ncu', 'nct', 'imo', 'kdi', 'kdc', 'buk', 'bum', 'bul', 'kde', 'nld', 'kdh', 'cui', 'kdl', 'sja', 'ita', 'zca', 'avt', 'mmx', 'pps', 'duo', 'ipi', 'mva', 'pio', 'pib', 'smo', 'mvn', 'smk', 'ven', 'cfm', 'pir', 'jra', 'gfk', 'lex', 'xsb', 'xsm', 'bru', 'nuy', 'hin', 'hil', 'ctp', 'xsr', 'bre', 'stp', 'nhw', 'emi', 'njo', 'viv', 'kvn', 'nzm', 'kvj', 'mmn', 'mmo', 'kgk', 'pbb', 'cbs', 'emp', 'zyp'}
 
@@ -59,12 +257,10 @@ def available_uriel_languages():
     #for feature_set in FEATURE_SETS_DICT:
     for feature_set in ["fam"]:
         filename, source, prefix = FEATURE_SETS_DICT[feature_set]
-        filename = pkg_resources.resource_filename(__name__, os.path.join('data', filename))
-        feature_database = np.load(filename)
+        feature_database = load_database(filename)
         mask = np.all(feature_database["data"] != -1.0, axis=0)
-        langs = [feature_database["langs"][i] for i,m in enumerate(mask) if np.sum(m)>0]
-        for l in langs:
-            avail.add(l)
+        langs = feature_database["langs"][:len(mask)][np.any(mask, axis=1)]
+        avail.update(langs.tolist())
     return avail
 
 def available_learned_languages():
@@ -83,35 +279,69 @@ def available_distance_languages():
         l = inp.readlines()[0]
     return l.strip().split(',')
 
-LANGUAGES = available_languages()
-URIEL_LANGUAGES = available_uriel_languages()
-LEARNED_LANGUAGES = available_learned_languages()
-FEATURE_SETS = available_feature_sets()
-DISTANCE_LANGUAGES = available_distance_languages()
+def load_letter_codes():
+    with open(LETTER_CODES_FILE, 'r') as letter_file:
+        return json.load(letter_file)
+
+def index_distance_languages():
+    return { l: i for i, l in enumerate(get_constant("DISTANCE_LANGUAGES")) }
+
+_LAZY_CONSTANTS = {
+    "LETTER_CODES": load_letter_codes,
+    "LANGUAGES": available_languages,
+    "URIEL_LANGUAGES": available_uriel_languages,
+    "LEARNED_LANGUAGES": available_learned_languages,
+    "FEATURE_SETS": available_feature_sets,
+    "DISTANCE_LANGUAGES": available_distance_languages,
+    "DISTANCE_LANGUAGE_INDEX": index_distance_languages,
+}
+
+def get_constant(name):
+    # computed once, then stored as a regular module global
+    value = globals().get(name)
+    if value is None:
+        value = _load_once(("constant", name), lambda: globals().get(name), lambda: _compute_constant(name))
+    return value
+
+def _compute_constant(name):
+    value = _LAZY_CONSTANTS[name]()
+    globals()[name] = value
+    return value
+
+def __getattr__(name):
+    if name in _LAZY_CONSTANTS:
+        return get_constant(name)
+    raise AttributeError("module " + __name__ + " has no attribute " + name)
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_CONSTANTS))
+
 DISTANCES = ["genetic", "geographic", "syntactic", "inventory", "phonological", "featural"]
 
 def get_language_code(lang_code, feature_database):
     # first, normalize to an ISO 639-3 code
-    if lang_code in LETTER_CODES:
-        lang_code = LETTER_CODES[lang_code]
-    if lang_code not in feature_database["langs"]:
+    letter_codes = get_constant("LETTER_CODES")
+    if lang_code in letter_codes:
+        lang_code = letter_codes[lang_code]
+    if lang_code not in feature_database["lang_index"]:
         message = "Note: Language " + lang_code + " not found in the URIEL database. "
         message += "Run lang2vec.LANGUAGES or lang2vec.available_languages()  to see a list of URIEL-supported languages. "
-        if lang_code in LEARNED_LANGUAGES:
+        if lang_code in get_constant("LEARNED_LANGUAGES"):
             message += "\nOnly a 'learned' feature vector is available.\n"
             message += "(run lang2vec.LEARNED_LANGUAGES or lang2vec.available_learned_languages() for a list of supported languages)"
-            print(message)
+            logger.warning(message)
             return "not_found"
         raise Exception(message)
     return lang_code
 
 def get_learned_language_code(lang_code, feature_database):
     # first, normalize to an ISO 639-3 code
-    if lang_code in LETTER_CODES:
-        lang_code = LETTER_CODES[lang_code]
-    if lang_code not in feature_database["langs"]:
-        if lang_code in URIEL_LANGUAGES:
-            print("Note: Language " + lang_code + " not found in the 'learned' feature set."+
+    letter_codes = get_constant("LETTER_CODES")
+    if lang_code in letter_codes:
+        lang_code = letter_codes[lang_code]
+    if lang_code not in feature_database["lang_index"]:
+        if lang_code in get_constant("URIEL_LANGUAGES"):
+            logger.warning("Note: Language " + lang_code + " not found in the 'learned' feature set."+
                 " However, it is available in the URIEL feature sets.")
             return "not_found"
         else:
@@ -126,45 +356,101 @@ def get_learned_language_code(lang_code, feature_database):
 def get_language_index(lang_code, feature_database):
     if lang_code == "not_found":
         return -1
-    return np.where(feature_database["langs"] == lang_code)[0][0]
+    return feature_database["lang_index"][lang_code]
+
+def get_language_indices(lang_codes, feature_database):
+    lang_index = feature_database["lang_index"]
+    return np.array([ lang_index.get(l, -1) for l in lang_codes ], dtype=np.intp)
     
 def get_source_index(source_name, feature_database):
     return np.where(feature_database["sources"] == source_name)[0]
 
 def get_feature_names(feature_name_prefix, feature_database):
-    return [ f for f in feature_database["feats"] if f.startswith(feature_name_prefix) ]
+    feature_indices = get_prefix_index(feature_name_prefix, feature_database)
+    return feature_database["feats"][feature_indices].tolist()
 
 def get_feature_index(feature_name, feature_database):
-    return np.where(feature_database["feats"] == feature_name)[0][0]
+    return feature_database["feat_index"][feature_name]
+
+def get_prefix_index(feature_name_prefix, feature_database):
+    prefix_index = feature_database["prefix_index"]
+    if feature_name_prefix not in prefix_index:
+        return np.array([ i for i, f in enumerate(feature_database["feats"].tolist()) if f.startswith(feature_name_prefix) ], dtype=np.intp)
+    return prefix_index[feature_name_prefix]
     
-def get_id_set(lang_codes):
+def get_id_set(lang_codes, sparse_output=False):
     #feature_database = np.load("family_features.npz")
-    filename = "family_features.npz"
-    filename = pkg_resources.resource_filename(__name__, os.path.join('data', filename))
-    feature_database = np.load(filename)
+    feature_database = load_database("family_features.npz")
     lang_codes = [ get_language_code(l, feature_database) for l in lang_codes ]
-    all_languages = list(feature_database["langs"])
+    all_languages = feature_database["langs"].tolist()
     feature_names = [ "ID_" + l.upper() for l in all_languages ]
+    lang_indices = get_language_indices(lang_codes, feature_database)
+    if sparse_output:
+        import scipy.sparse
+        shape = (len(lang_codes), len(feature_names))
+        values = scipy.sparse.csr_matrix((np.ones(len(lang_codes)), lang_indices % shape[1], np.arange(len(lang_codes) + 1)), shape=shape)
+        return feature_names, values
     values = np.zeros((len(lang_codes), len(feature_names)))
-    for i, lang_code in enumerate(lang_codes):
-        feature_index = get_language_index(lang_code, feature_database)
-        values[i, feature_index] = 1.0
+    values[np.arange(len(lang_codes)), lang_indices] = 1.0
     return feature_names, values
 
+# learned.npy is a pickled dictionary of 512-d vectors. It is unpickled only once, to
+# convert it into a (languages x 512) float32 matrix and an array of language codes,
+# which are stored as plain .npy files in the cache directory and memory-mapped.
+def convert_learned_vectors(path):
+    vectors = np.load(path, encoding="latin1", allow_pickle=True).item()
+    langs = sorted( l for l, v in vectors.items() if np.asarray(v).dtype.kind == 'f' )
+    data = np.empty((len(langs), 512), dtype=np.float32)
+    for i, l in enumerate(langs):
+        data[i] = vectors[l]
+    return np.array(langs), data
+
+def build_learned_cache(path=None, force=False):
+    if path is None:
+        path = get_database_path("learned.npy")
+    cache_path = os.path.join(get_cache_dir(), "learned", _source_key(path))
+    if not force and _cache_is_valid(cache_path, path):
+        return cache_path
+    langs, data = convert_learned_vectors(path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix="learned.", dir=os.path.dirname(cache_path))
+    try:
+        np.save(os.path.join(tmp_path, "langs.npy"), langs)
+        np.save(os.path.join(tmp_path, "data.npy"), data)
+        with open(os.path.join(tmp_path, "meta.json"), 'w') as out:
+            json.dump(_source_stamp(path), out)
+        _publish_cache(tmp_path, cache_path, path, replace=force)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return cache_path
+
+def read_learned_database(path):
+    try:
+        cache_path = build_learned_cache(path)
+        feature_database = {
+            "langs": np.load(os.path.join(cache_path, "langs.npy")),
+            "data": np.load(os.path.join(cache_path, "data.npy"), mmap_mode='r'),
+        }
+    except (IOError, OSError):
+        if not os.path.exists(path):
+            raise
+        # e.g. a read-only cache directory
+        langs, data = convert_learned_vectors(path)
+        feature_database = {"langs": langs, "data": data}
+    feature_database["data"].flags.writeable = False
+    feature_database["feats"] = np.array([ "LEARNED_%03d" % i for i in range(feature_database["data"].shape[1]) ])
+    index_database(feature_database)
+    return feature_database
+
 def get_learned_set(lang_codes):
-    filename = "learned.npy"
-    filename = pkg_resources.resource_filename(__name__, os.path.join('data', filename))
-    feature_database = np.load(filename, encoding="latin1").item()
+    feature_database = load_database("learned.npy")
     lang_codes = [ get_learned_language_code(l, feature_database) for l in lang_codes ]
     feature_names = [ "LEARNED_%03d" % i for i in range(512) ]
-    feature_values = np.ones((len(lang_codes),512))*(-1)
-    for i, lang_code in enumerate(lang_codes):
-        if lang_code != "not_found":
-            feature_values[i] = feature_database[lang_code]
-
+    lang_indices = get_language_indices(lang_codes, feature_database)
+    feature_values = feature_database["data"][np.maximum(lang_indices, 0)].astype(np.float64)
+    feature_values[lang_indices == -1] = -1
     return feature_names, feature_values
 
-    
 def get_named_set(lang_codes, feature_set):
     if feature_set == 'id':
         return get_id_set(lang_codes)
@@ -177,52 +463,211 @@ def get_named_set(lang_codes, feature_set):
             " lang2vec.available_feature_sets() to see the available feature sets.")
         
     filename, source, prefix = FEATURE_SETS_DICT[feature_set]
-    filename = pkg_resources.resource_filename(__name__, os.path.join('data', filename))
-    feature_database = np.load(filename)
+    start = _profile_start()
+    feature_database = load_database(filename)
+    start = _profile_stage("get_named_set.load", start)
     lang_codes = [ get_language_code(l, feature_database) for l in lang_codes ]
-    lang_indices = [ get_language_index(l, feature_database) for l in lang_codes ]
+    lang_indices = get_language_indices(lang_codes, feature_database)
+    start = _profile_stage("get_named_set.resolve", start)
     feature_names = get_feature_names(prefix, feature_database)
-    feature_indices = [ get_feature_index(f, feature_database) for f in feature_names ]
+    feature_indices = get_prefix_index(prefix, feature_database)
     source_index = get_source_index(source, feature_database)
-    feature_values = np.ones((len(lang_indices), len(feature_indices), len(source_index)))*(-1)
-    feature_values = feature_database["data"][lang_indices,:,:][:,feature_indices,:][:,:,source_index]
-    for i,l in enumerate(lang_indices):
-        if l == -1:
-            feature_values[i] = np.ones(features_values[i].shape)*(-1)
+    feature_values = feature_database["data"][np.ix_(lang_indices, feature_indices, source_index)]
+    feature_values[lang_indices == -1] = -1
     feature_values = feature_values.squeeze(axis=2)
+    if _PROFILING:
+        _profile_stage("get_named_set.gather", start)
+        _profile_count("languages_resolved", len(lang_codes))
+        _profile_count("matrix_cells", feature_values.size)
     return feature_names, feature_values
 
-def get_union_sets(lang_codes, feature_set_str):
+# A feature set expression such as "geo+syntax_wals|syntax_sswl" is compiled once into
+# a plan: the columns needed from each backing file (as (feature, source) pairs), and for
+# every concatenated part the slices of those columns whose elementwise maximum it is.
+# Executing a plan resolves the languages and gathers the data once per file.
+FeatureSetPlan = namedtuple("FeatureSetPlan", ["feature_names", "parts", "files"])
+PLAN_CACHE_SIZE = 128
+_PLAN_CACHE = OrderedDict()
+
+def _plan_member(feature_set, files):
+    if feature_set == 'id':
+        all_languages = load_database("family_features.npz")["langs"].tolist()
+        return [ "ID_" + l.upper() for l in all_languages ], ("id",)
+    if feature_set == "learned":
+        return [ "LEARNED_%03d" % i for i in range(512) ], ("learned",)
+
+    if feature_set not in FEATURE_SETS_DICT:
+        raise Exception("ERROR: Invalid feature set " + str(feature_set) +
+            ". You can run lang2vec.FEATURE_SETS or " + 
+            " lang2vec.available_feature_sets() to see the available feature sets.")
+
+    filename, source, prefix = FEATURE_SETS_DICT[feature_set]
+    feature_database = load_database(filename)
+    feature_names = get_feature_names(prefix, feature_database)
+    feature_indices = get_prefix_index(prefix, feature_database)
+    source_index = get_source_index(source, feature_database)[0]
+    columns, sources = files.setdefault(filename, ([], []))
+    start = sum(len(c) for c in columns)
+    columns.append(feature_indices)
+    sources.append(np.full(len(feature_indices), source_index, dtype=np.intp))
+    return feature_names, (filename, start, start + len(feature_indices))
+
+def compile_feature_sets(feature_set_str):
     if isinstance(feature_set_str, str):
-        feature_set_parts = feature_set_str.split("|")
+        key = feature_set_str
+        feature_set_parts = feature_set_str.split("+")
     elif isinstance(feature_set_str, list):
+        key = tuple(tuple(part) if isinstance(part, list) else part for part in feature_set_str)
         feature_set_parts = feature_set_str
     else:
-        raise Exception("Improper type "+type(feature_set_str)+" for feature_set.\nRequires string or list of strings.")
-    feature_names, feature_values = get_named_set(lang_codes, feature_set_parts[0])
-    for feature_set_part in feature_set_parts[1:]:
-        more_feature_names, more_feature_values = get_named_set(lang_codes, feature_set_part)
-        if len(feature_names) != len(more_feature_names):
-            #print("ERROR: Cannot perform elementwise union on feature sets of different size")
-            raise Exception("ERROR: Cannot perform elementwise union on feature sets of different size")
-            #sys.exit(0)
-        feature_values = np.maximum(feature_values, more_feature_values)
-    return feature_names, feature_values
-    
-def get_concatenated_sets(lang_codes, feature_set_str):
+        raise Exception("Improper type "+str(type(feature_set_str))+" for feature_set.\nRequires string or list of strings.")
+    with _DATABASE_LOCK:
+        if key in _PLAN_CACHE:
+            _PLAN_CACHE.move_to_end(key)
+            if _PROFILING:
+                _profile_count("plan_cache_hits")
+            return _PLAN_CACHE[key]
+    start = _profile_start()
+
+    feature_names = []
+    parts = []
+    files = OrderedDict()
+    for feature_set_part in feature_set_parts:
+        if isinstance(feature_set_part, str):
+            union_parts = feature_set_part.split("|")
+        elif isinstance(feature_set_part, list):
+            union_parts = feature_set_part
+        else:
+            raise Exception("Improper type "+str(type(feature_set_part))+" for feature_set.\nRequires string or list of strings.")
+        part_names = None
+        members = []
+        for union_part in union_parts:
+            more_feature_names, member = _plan_member(union_part, files)
+            if part_names is None:
+                part_names = more_feature_names
+            elif len(part_names) != len(more_feature_names):
+                raise Exception("ERROR: Cannot perform elementwise union on feature sets of different size")
+            members.append(member)
+        parts.append((len(feature_names), len(feature_names) + len(part_names), members))
+        feature_names += part_names
+    files = OrderedDict((filename, (np.concatenate(columns), np.concatenate(sources))) for filename, (columns, sources) in files.items())
+    plan = FeatureSetPlan(feature_names, parts, files)
+
+    with _DATABASE_LOCK:
+        _PLAN_CACHE[key] = plan
+        while len(_PLAN_CACHE) > PLAN_CACHE_SIZE:
+            _PLAN_CACHE.popitem(last=False)
+    if _PROFILING:
+        _profile_stage("compile_feature_sets", start)
+        _profile_count("plan_cache_misses")
+    return plan
+
+# Files whose sets ("fam", and "id" which is derived from it) are mostly zeros, and are
+# kept as scipy.sparse CSR matrices when sparse output is requested.
+SPARSE_FEATURE_FILES = {"family_features.npz"}
+
+def get_sparse_data(feature_database, source_index):
+    import scipy.sparse
+    with _DATABASE_LOCK:
+        sparse_data = feature_database.setdefault("sparse_data", {})
+        if source_index not in sparse_data:
+            sparse_data[source_index] = scipy.sparse.csr_matrix(feature_database["data"][:, :, source_index])
+        return sparse_data[source_index]
+
+def _gather_sparse(feature_database, lang_indices, columns, source_index):
+    missing = lang_indices == -1
+    values = get_sparse_data(feature_database, source_index)[np.where(missing, 0, lang_indices)][:, columns]
+    if missing.any():
+        values = values.tolil()
+        values[np.nonzero(missing)[0]] = -1
+        values = values.tocsr()
+    return values
+
+def execute_feature_set_plan(plan, lang_codes, dtype=np.float64, sparse_output=False):
+    # one language resolution and one gather per backing file
+    blocks = {}
+    lang_indices = {}
+    for filename, (columns, sources) in plan.files.items():
+        start = _profile_start()
+        feature_database = load_database(filename)
+        start = _profile_stage("feature_sets.load", start)
+        resolved_codes = [ get_language_code(l, feature_database) for l in lang_codes ]
+        lang_indices[filename] = get_language_indices(resolved_codes, feature_database)
+        start = _profile_stage("feature_sets.resolve", start)
+        if _PROFILING:
+            _profile_count("languages_resolved", len(lang_codes))
+        if sparse_output and filename in SPARSE_FEATURE_FILES:
+            continue
+        block = feature_database["data"][lang_indices[filename][:, None], columns[None, :], sources[None, :]]
+        block[lang_indices[filename] == -1] = -1
+        blocks[filename] = block
+        _profile_stage("feature_sets.gather", start)
+
+    # the dense parts are reduced in place into the output, or into a copy of the
+    # requested dtype when the parts are stacked as a sparse matrix
+    start = _profile_start()
+    parts = []
+    if not sparse_output:
+        feature_values = np.empty((len(lang_codes), len(plan.feature_names)), dtype=dtype)
+    for part_start, part_end, members in plan.parts:
+        out = None if sparse_output else feature_values[:, part_start:part_end]
+        for k, member in enumerate(members):
+            if member[0] == "id":
+                values = get_id_set(lang_codes, sparse_output=sparse_output)[1]
+            elif member[0] == "learned":
+                values = get_learned_set(lang_codes)[1]
+            elif member[0] not in blocks:
+                filename, member_start, member_end = member
+                columns, sources = plan.files[filename]
+                values = _gather_sparse(load_database(filename), lang_indices[filename], columns[member_start:member_end], sources[member_start])
+            else:
+                filename, member_start, member_end = member
+                values = blocks[filename][:, member_start:member_end]
+            if hasattr(values, "maximum"):
+                values = values.astype(dtype, copy=False)
+            if not sparse_output and k == 0:
+                out[...] = values
+            elif out is None:
+                out = values if hasattr(values, "maximum") else values.astype(dtype)
+            elif hasattr(out, "maximum"):
+                out = out.maximum(values)
+            elif hasattr(values, "maximum"):
+                out = values.maximum(out)
+            else:
+                # the members are cast to the requested (possibly integer) dtype
+                np.maximum(out, values, out=out, casting="unsafe")
+        if sparse_output:
+            parts.append(out)
+    start = _profile_stage("feature_sets.union", start)
+
+    if sparse_output and any(hasattr(part, "tocsr") for part in parts):
+        import scipy.sparse
+        feature_values = scipy.sparse.hstack(parts, format="csr", dtype=dtype)
+    elif sparse_output:
+        feature_values = np.empty((len(lang_codes), len(plan.feature_names)), dtype=dtype)
+        for (part_start, part_end, members), part in zip(plan.parts, parts):
+            feature_values[:, part_start:part_end] = part
+    if _PROFILING:
+        _profile_stage("feature_sets.concat", start)
+        _profile_count("matrix_cells", feature_values.shape[0] * feature_values.shape[1])
+    return list(plan.feature_names), feature_values
+
+def get_union_sets(lang_codes, feature_set_str, dtype=np.float64, sparse_output=False):
     if isinstance(feature_set_str, str):
-        feature_set_parts = feature_set_str.split("+")
+        feature_set_parts = feature_set_str.split("|")
     elif isinstance(feature_set_str, list):
         feature_set_parts = feature_set_str
     else:
-        raise Exception("Improper type "+type(feature_set_str)+" for feature_set.\nRequires string or list of strings.")
-    feature_names = []
-    feature_values = np.ndarray((len(lang_codes),0))
-    for feature_set_part in feature_set_parts:
-        more_feature_names, more_feature_values = get_union_sets(lang_codes, feature_set_part)
-        feature_names += more_feature_names
-        feature_values = np.concatenate([feature_values, more_feature_values], axis=1)
-    return feature_names, feature_values
+        raise Exception("Improper type "+str(type(feature_set_str))+" for feature_set.\nRequires string or list of strings.")
+    plan = compile_feature_sets([feature_set_parts])
+    return execute_feature_set_plan(plan, lang_codes, dtype=dtype, sparse_output=sparse_output)
+    
+def get_concatenated_sets(lang_codes, feature_set_str, dtype=np.float64, sparse_output=False):
+    start = _profile_start()
+    plan = compile_feature_sets(feature_set_str)
+    result = execute_feature_set_plan(plan, lang_codes, dtype=dtype, sparse_output=sparse_output)
+    _profile_stage("get_concatenated_sets", start)
+    return result
 
 def fs_concatenation(fs1, *args):
     fs_s = []
@@ -305,36 +750,161 @@ def fs_union(fs1,*args):
     
     
 
-def get_features(languages, feature_set_inp, header=False, minimal=False):    
+# Result of get_features(..., output="array"): a (languages x features) matrix, the
+# feature names and the language codes as arrays, and the boolean mask of missing
+# values when missing="mask" (otherwise missing values are NaN and mask is None).
+FeatureMatrix = namedtuple("FeatureMatrix", ["values", "feature_names", "languages", "mask"])
+
+def get_minimal_mask(feature_values):
+    # columns that contain only zeros, only ones, or only nulls
+    if hasattr(feature_values, "tocsr"):
+        feature_values = feature_values.tocsr()
+        num_rows, num_columns = feature_values.shape
+        columns, data = feature_values.indices, feature_values.data
+        nonzero = np.bincount(columns, weights=(data != 0), minlength=num_columns)
+        ones = np.bincount(columns, weights=(data == 1), minlength=num_columns)
+        nulls = np.bincount(columns, weights=(data == -1), minlength=num_columns)
+        return (nonzero == 0) | (ones == num_rows) | (nulls == num_rows)
+    mask = np.all(feature_values == 0.0, axis=0)
+    mask |= np.all(feature_values == 1.0, axis=0)
+    mask |= np.all(feature_values == -1.0, axis=0)
+    return mask
+
+def get_features(languages, feature_set_inp, header=False, minimal=False, output="dict", dtype=np.float32, missing="nan", sparse_output=False):    
     if isinstance(languages, str):
         lang_codes = languages.split()
     elif isinstance(languages, list):
         lang_codes = languages 
     else:
-        raise Exception("Improper type "+type(languages)+" for languages.\nRequires string or list of strings.")
+        raise Exception("Improper type "+str(type(languages))+" for languages.\nRequires string or list of strings.")
+    if output not in ("dict", "array"):
+        raise Exception("Unknown output mode " + str(output) + ". Use 'dict' or 'array'.")
+    if output == "array":
+        if missing not in ("nan", "mask"):
+            raise Exception("Unknown missing value mode " + str(missing) + ". Use 'nan' or 'mask'.")
+        if missing == "nan" and not np.issubdtype(dtype, np.floating):
+            raise Exception("Missing values can only be NaN for floating point dtypes; use missing='mask' with " + np.dtype(dtype).name + ".")
+    else:
+        dtype = np.float64
         
-    feature_names, feature_values = get_concatenated_sets(lang_codes, feature_set_inp)
+    start = total_start = _profile_start()
+    feature_names, feature_values = get_concatenated_sets(lang_codes, feature_set_inp, dtype=dtype, sparse_output=sparse_output)
     feature_names = np.array([ f.replace(" ","_") for f in feature_names ])
+    is_sparse = hasattr(feature_values, "tocsr")
+    start = _profile_stage("get_features.sets", start)
 
     if minimal:
-        mask = np.all(feature_values == 0.0, axis=0)
-        mask |= np.all(feature_values == 1.0, axis=0)
-        mask |= np.all(feature_values == -1.0, axis=0)
-        unmasked_indices = np.where(np.logical_not(mask))
-    else:
-        unmasked_indices = np.where(np.ones(feature_values.shape[1]))
+        mask = get_minimal_mask(feature_values)
+        unmasked_indices = np.where(np.logical_not(mask))[0]
+        if len(unmasked_indices) < feature_values.shape[1]:
+            feature_names = feature_names[unmasked_indices]
+            feature_values = feature_values[:, unmasked_indices]
+        start = _profile_stage("get_features.minimal", start)
+
+    if output == "array":
+        if is_sparse:
+            missing_mask = feature_values == -1
+            if missing == "nan":
+                feature_values.data[feature_values.data == -1] = np.nan
+                missing_mask = None
+        else:
+            missing_mask = feature_values == -1
+            if missing == "nan":
+                feature_values[missing_mask] = np.nan
+                missing_mask = None
+        if _PROFILING:
+            _profile_stage("get_features.format", start)
+            _profile_stage("get_features", total_start)
+            _profile_count("languages_requested", len(lang_codes))
+        return FeatureMatrix(feature_values, feature_names, np.array(lang_codes), missing_mask)
     
     output = {}
     if header:
-        output['CODE']=list(feature_names[unmasked_indices])
-        
-    for i, lang_code in enumerate(lang_codes):
-        values = feature_values[i,unmasked_indices].ravel()
+        output['CODE']=list(feature_names)
+
+    if is_sparse:
+        # densify a chunk of rows at a time
+        rows = ( row for start in range(0, len(lang_codes), 1024) for row in feature_values[start:start+1024].toarray().tolist() )
+    else:
+        rows = feature_values.tolist()
+    for lang_code, values in zip(lang_codes, rows):
         values = [ '--' if f == -1 else f for f in values ]
         #print("\t".join([lang_code]+values))
         output[lang_code] = values
+    if _PROFILING:
+        _profile_stage("get_features.format", start)
+        _profile_stage("get_features", total_start)
+        _profile_count("languages_requested", len(lang_codes))
     return output
 
+# Compact representation of binary features: per language, a bitset of the feature
+# values and a bitset of the features that are present (not -1), packed in uint64 words.
+# Values of non-binary sets (e.g. the averages) are thresholded at 0.5.
+PackedFeatures = namedtuple("PackedFeatures", ["values", "present", "feature_names", "languages"])
+
+def _pack_bits(bits):
+    packed = np.packbits(bits, axis=1, bitorder="little")
+    padding = (-packed.shape[1]) % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def pack_features(feature_values, missing_mask, feature_names=None, languages=None):
+    present = np.logical_not(missing_mask)
+    values = np.logical_and(feature_values >= 0.5, present)
+    return PackedFeatures(_pack_bits(values), _pack_bits(present), feature_names, languages)
+
+def pack_feature_set(feature_set_inp, languages=None):
+    if languages is None:
+        languages = load_database("features.npz")["langs"].tolist()
+    result = get_features(languages, feature_set_inp, output="array", dtype=np.float32, missing="mask")
+    return pack_features(result.values, result.mask, result.feature_names, result.languages)
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([ bin(i).count("1") for i in range(256) ], dtype=np.uint8)
+    def popcount(words):
+        bytes_ = np.ascontiguousarray(words).view(np.uint8)
+        return _POPCOUNT_TABLE[bytes_].sum(axis=-1, dtype=np.int64)
+
+def packed_distance(packed, other=None, metric="hamming", block_size=None):
+    # Distances over the features present in both languages: the fraction of them
+    # that differ ("hamming"), or one minus the cosine similarity ("cosine", 1 when
+    # either vector is all zeros there). Pairs without any shared feature get NaN.
+    if metric not in ("hamming", "cosine"):
+        raise Exception("Unknown metric " + str(metric) + ". Use 'hamming' or 'cosine'.")
+    if other is None:
+        other = packed
+    n, m = len(packed.values), len(other.values)
+    words = packed.values.shape[1]
+    if block_size is None:
+        # keep each temporary around 4M words
+        block_size = max(1, (1 << 22) // max(1, m * words))
+    out = np.empty((n, m), dtype=np.float64)
+    other_values, other_present = other.values[None, :, :], other.present[None, :, :]
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        values, present = packed.values[start:end, None, :], packed.present[start:end, None, :]
+        shared = present & other_present
+        if metric == "hamming":
+            total = popcount(shared)
+            different = popcount((values ^ other_values) & shared)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[start:end] = different / total
+        else:
+            a = popcount(values & shared)
+            b = popcount(other_values & shared)
+            both = popcount(values & other_values & shared)
+            norms = np.sqrt(a * b)
+            # a language with none of the shared features set (e.g. an isolate in
+            # "fam") is at the maximal distance 1
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[start:end] = np.where(norms > 0, 1.0 - both / norms, 1.0)
+            out[start:end][popcount(shared) == 0] = np.nan
+    return out
+
 def map_distance_to_filename(distance):
     d = {"genetic": "genetic_upper_sparse.npz",
      "geographic": "geographic_upper_round1_sparse.npz", 
@@ -345,6 +915,250 @@ def map_distance_to_filename(distance):
     return d[distance]
 
 
+# The distance matrices are unpacked once from DISTANCES_FILE into uncompressed CSR
+# component arrays under the cache directory, and memory-mapped from there. Processes
+# on the same host share the pages through the OS page cache.
+_DISTANCE_CACHE = {}
+
+def get_cache_dir():
+    cache_dir = os.environ.get("LANG2VEC_CACHE_DIR")
+    if not cache_dir:
+        cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "lang2vec")
+    return cache_dir
+
+def get_distance_cache_path(distance):
+    return os.path.join(get_cache_dir(), "distances", _source_key(DISTANCES_FILE), distance)
+
+def _source_stamp(source):
+    stat = os.stat(source)
+    return {"source": os.path.abspath(source), "size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+def _source_key(source):
+    # The cache directories are keyed by the stamp of the file they are converted from,
+    # so that installs sharing a cache directory (or an updated file) get directories of
+    # their own instead of replacing each other's under their readers.
+    stamp = json.dumps(_source_stamp(source), sort_keys=True)
+    return hashlib.sha1(stamp.encode("utf-8")).hexdigest()[:16]
+
+def _cache_is_valid(path, source):
+    # the cache records the size and mtime of the file it was converted from
+    try:
+        with open(os.path.join(path, "meta.json")) as inp:
+            meta = json.load(inp)
+    except (IOError, OSError, ValueError):
+        return False
+    return {key: meta.get(key) for key in ("source", "size", "mtime")} == _source_stamp(source)
+
+def _publish_cache(tmp_path, path, source, replace=False):
+    # move a fully written cache directory into place; a valid copy that is already
+    # there (e.g. from another process) is kept unless replace is set
+    if os.path.isdir(path) and (replace or not _cache_is_valid(path, source)):
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        if not _cache_is_valid(path, source):
+            raise
+
+def build_distance_cache(distances=None, force=False):
+    import scipy.sparse as sparse
+    if distances is None:
+        distances = DISTANCES
+    elif isinstance(distances, str):
+        distances = [distances]
+    built = []
+    stamp = _source_stamp(DISTANCES_FILE)
+    with zf(DISTANCES_FILE, 'r') as zp:
+        for dist in distances:
+            path = get_distance_cache_path(dist)
+            if not force and _cache_is_valid(path, DISTANCES_FILE):
+                continue
+            data = sparse.load_npz(zp.open(map_distance_to_filename(dist))).tocsr()
+            data.sum_duplicates()
+            data.sort_indices()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write into a private directory first, so that concurrent builders and
+            # readers never see a half-written cache
+            tmp_path = tempfile.mkdtemp(prefix=dist + ".", dir=os.path.dirname(path))
+            try:
+                np.save(os.path.join(tmp_path, "data.npy"), data.data)
+                np.save(os.path.join(tmp_path, "indices.npy"), data.indices)
+                np.save(os.path.join(tmp_path, "indptr.npy"), data.indptr)
+                meta = dict(stamp, shape=list(data.shape))
+                with open(os.path.join(tmp_path, "meta.json"), 'w') as out:
+                    json.dump(meta, out)
+                _publish_cache(tmp_path, path, DISTANCES_FILE, replace=force)
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            built.append(dist)
+    return built
+
+def load_distance_matrix(distance):
+    with _DATABASE_LOCK:
+        if distance in _DISTANCE_CACHE:
+            if _PROFILING:
+                _profile_count("distance_cache_hits")
+            return _DISTANCE_CACHE[distance]
+    return _load_once(("distance", distance), lambda: _DISTANCE_CACHE.get(distance), lambda: _read_distance_matrix(distance))
+
+def _read_distance_matrix(distance):
+    import scipy.sparse as sparse
+    start = _profile_start()
+    path = get_distance_cache_path(distance)
+    try:
+        if not _cache_is_valid(path, DISTANCES_FILE):
+            build_distance_cache([distance])
+        with open(os.path.join(path, "meta.json")) as inp:
+            shape = tuple(json.load(inp)["shape"])
+        components = [ np.load(os.path.join(path, name + ".npy"), mmap_mode='r') for name in ("data", "indices", "indptr") ]
+        data = sparse.csr_matrix(tuple(components), shape=shape, copy=False)
+    except (IOError, OSError):
+        # e.g. a read-only cache directory: keep an in-memory copy instead
+        if not os.path.exists(DISTANCES_FILE):
+            raise
+        with zf(DISTANCES_FILE, 'r') as zp:
+            data = sparse.load_npz(zp.open(map_distance_to_filename(distance))).tocsr()
+        data.sum_duplicates()
+        data.sort_indices()
+    if _PROFILING:
+        _profile_stage("load_distance_matrix", start)
+        _profile_count("distance_cache_misses")
+        _profile_count("files_loaded")
+        _profile_count("bytes_loaded", data.data.nbytes + data.indices.nbytes + data.indptr.nbytes)
+    with _DATABASE_LOCK:
+        _DISTANCE_CACHE[distance] = data
+    return data
+
+def get_pair_distance(data, i, j):
+    # binary search in a single row of the upper triangular matrix
+    if i > j:
+        i, j = j, i
+    start, end = data.indptr[i], data.indptr[i+1]
+    k = start + np.searchsorted(data.indices[start:end], j)
+    if k < end and data.indices[k] == j:
+        return data.data[k]
+    return data.data.dtype.type(0)
+
+def get_pair_distances(data, rows, cols):
+    # vectorized version of get_pair_distance for arrays of row and column indices
+    rows, cols = np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)
+    upper_rows, upper_cols = np.minimum(rows, cols), np.maximum(rows, cols)
+    if len(rows) == 0:
+        return np.zeros(0, dtype=data.dtype)
+    return np.asarray(data[upper_rows, upper_cols]).ravel()
+
+# For each language, its NEIGHBOR_TABLE_SIZE closest languages under each metric, built
+# from the upper triangular matrices and stored next to them in the cache directory.
+NEIGHBOR_TABLE_SIZE = 100
+_NEIGHBOR_CACHE = {}
+
+def _distance_rows(data, columns, rows):
+    # dense rows (a slice or an array of indices) of the full symmetric matrix, from the
+    # rows and the columns (columns = data.tocsc()) of the upper triangular one
+    full_rows = data[rows].toarray().astype(np.float64)
+    full_rows += columns[:, rows].toarray().T
+    return full_rows
+
+def build_neighbor_table(distance, size=NEIGHBOR_TABLE_SIZE, block_size=256):
+    data = load_distance_matrix(distance)
+    columns = data.tocsc()
+    N = data.shape[0]
+    size = min(size, N - 1)
+    indices = np.empty((N, size), dtype=np.int32)
+    distances = np.empty((N, size), dtype=data.dtype)
+    for start in range(0, N, block_size):
+        end = min(start + block_size, N)
+        rows = _distance_rows(data, columns, slice(start, end))
+        rows[np.arange(end - start), np.arange(start, end)] = np.inf
+        nearest = np.argpartition(rows, size - 1, axis=1)[:, :size]
+        values = np.take_along_axis(rows, nearest, axis=1)
+        order = np.argsort(values, axis=1, kind="stable")
+        indices[start:end] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:end] = np.take_along_axis(values, order, axis=1)
+    return indices, distances
+
+def load_neighbor_table(distance, size=NEIGHBOR_TABLE_SIZE):
+    key = (distance, size)
+    return _load_once(("neighbors",) + key, lambda: _NEIGHBOR_CACHE.get(key), lambda: _read_neighbor_table(distance, size))
+
+def _read_neighbor_table(distance, size):
+    load_distance_matrix(distance)
+    path = os.path.join(get_distance_cache_path(distance), "neighbors_" + str(size))
+    valid = _cache_is_valid(path, DISTANCES_FILE)
+    try:
+        if not valid:
+            raise IOError("No neighbor table in " + path)
+        table = (np.load(os.path.join(path, "indices.npy"), mmap_mode='r'), np.load(os.path.join(path, "distances.npy"), mmap_mode='r'))
+    except (IOError, OSError, ValueError):
+        table = build_neighbor_table(distance, size=size)
+        # written into a private directory and moved into place like the distance
+        # cache, so that a half-written table is never memory-mapped
+        tmp_path = None
+        try:
+            tmp_path = tempfile.mkdtemp(prefix="neighbors_" + str(size) + ".", dir=os.path.dirname(path))
+            np.save(os.path.join(tmp_path, "indices.npy"), table[0])
+            np.save(os.path.join(tmp_path, "distances.npy"), table[1])
+            with open(os.path.join(tmp_path, "meta.json"), 'w') as out:
+                json.dump(_source_stamp(DISTANCES_FILE), out)
+            # a table with a valid stamp that failed to load is truncated: replace it
+            _publish_cache(tmp_path, path, DISTANCES_FILE, replace=valid)
+        except (IOError, OSError):
+            pass
+        finally:
+            if tmp_path is not None:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+    with _DATABASE_LOCK:
+        _NEIGHBOR_CACHE[(distance, size)] = table
+    return table
+
+def _nearest_from_row(values, candidate_indices, k):
+    k = min(k, len(values))
+    if k <= 0:
+        return []
+    nearest = np.argpartition(values, k - 1)[:k]
+    nearest = nearest[np.argsort(values[nearest], kind="stable")]
+    distance_languages = get_constant("DISTANCE_LANGUAGES")
+    return [ (distance_languages[candidate_indices[i]], float(values[i])) for i in nearest ]
+
+def nearest_languages(lang, distance, k=10, candidates=None):
+    return batch_nearest_languages([lang], distance, k=k, candidates=candidates)[distance][lang]
+
+def batch_nearest_languages(langs, distances=None, k=10, candidates=None):
+    # {distance: {lang: [(code, distance), ...]}} with the k closest languages first
+    if isinstance(langs, str):
+        langs = [langs]
+    if distances is None:
+        distances = DISTANCES
+    elif isinstance(distances, str):
+        distances = [distances]
+    for dist in distances:
+        if dist not in DISTANCES:
+            raise Exception("Unknown distance " + dist + ". The available ones are: " + ' '.join(DISTANCES))
+    indeces = get_distance_indices(langs)
+    if candidates is not None:
+        candidate_indices = get_distance_indices(list(candidates))
+    distance_languages = get_constant("DISTANCE_LANGUAGES")
+
+    output = {}
+    for dist in distances:
+        output[dist] = {}
+        if candidates is None and k <= NEIGHBOR_TABLE_SIZE:
+            neighbor_indices, neighbor_distances = load_neighbor_table(dist)
+            neighbor_indices, neighbor_distances = neighbor_indices[indeces, :k], neighbor_distances[indeces, :k]
+            for lang, row_indices, row_distances in zip(langs, neighbor_indices.tolist(), neighbor_distances.tolist()):
+                output[dist][lang] = [ (distance_languages[i], d) for i, d in zip(row_indices, row_distances) ]
+            continue
+        data = load_distance_matrix(dist)
+        for lang, i in zip(langs, indeces):
+            if candidates is None:
+                row_candidates = np.arange(data.shape[0])
+            else:
+                row_candidates = candidate_indices
+            row_candidates = row_candidates[row_candidates != i]
+            values = get_pair_distances(data, np.full(len(row_candidates), i), row_candidates)
+            output[dist][lang] = _nearest_from_row(values, row_candidates, k)
+    return output
+
 def query_yes_no(question, default="yes"):
     valid = {"yes": True, "y": True, "ye": True,
              "no": False, "n": False}
@@ -368,7 +1182,92 @@ def query_yes_no(question, default="yes"):
             sys.stdout.write("Please respond with 'yes' or 'no' "
                              "(or 'y' or 'n').\n")
 
-def distance(distance, *args):
+def get_distance_indices(langs):
+    distance_language_index = get_constant("DISTANCE_LANGUAGE_INDEX")
+    for l in langs:
+        if l not in distance_language_index:
+            raise Exception("Unknown language " + l + " (or maybe we don't have precomputed distances for this one).")
+    return np.array([ distance_language_index[l] for l in langs ], dtype=np.intp)
+
+def get_distance_matrix(data, indeces, condensed=False):
+    # one fancy index into the upper triangular matrix, mirrored into the lower half
+    N = len(indeces)
+    values = data[indeces][:, indeces].toarray().astype(np.float64)
+    upper = indeces[:, None] <= indeces[None, :]
+    arr = np.where(upper, values, values.T)
+    np.fill_diagonal(arr, 0.0)
+    if condensed:
+        return arr[np.triu_indices(N, 1)]
+    return arr
+
+# Distances computed directly from the feature sets, for languages without precomputed
+# values: cosine distances between the binary vectors below. The geographic distance is
+# only precomputed; get_geo_coordinates assumes an encoding of geocoord_features.npz
+# that has not been checked against the released file.
+COMPUTED_DISTANCE_SETS = {
+    "genetic": "fam",
+    "syntactic": "syntax_knn",
+    "inventory": "inventory_knn",
+    "phonological": "phonology_knn",
+    "featural": "syntax_knn+phonology_knn+inventory_knn",
+}
+DISTANCE_MODES = ["precomputed", "computed", "auto"]
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    # central angle in radians between points given in degrees; broadcasts
+    lat1, lon1, lat2, lon2 = [ np.radians(x) for x in (lat1, lon1, lat2, lon2) ]
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _parse_geo_point(feature_name):
+    match = re.search(r"(-?\d+(?:\.\d+)?)\D+?(-?\d+(?:\.\d+)?)$", feature_name)
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+def get_geo_coordinates(lang_codes, closest=6):
+    # Assumes that the "geo" set holds the proximity of each language to fixed points on
+    # the earth (one minus the great circle distance over the antipodal distance), and
+    # that the coordinates of the points are part of the feature names. Each language is
+    # located by least squares over its closest present points: p . x = cos(distance).
+    # NaN for the languages with fewer than 3 present points, and None when the feature
+    # names do not contain coordinates.
+    result = get_features(lang_codes, "geo", output="array", dtype=np.float64, missing="mask")
+    points = [ _parse_geo_point(f) for f in result.feature_names ]
+    if any(p is None for p in points):
+        return None
+    points = np.radians(np.array(points))
+    xyz = np.stack([np.cos(points[:, 0]) * np.cos(points[:, 1]), np.cos(points[:, 0]) * np.sin(points[:, 1]), np.sin(points[:, 0])], axis=1)
+    closest = min(closest, len(points))
+    proximity = np.where(result.mask, -np.inf, result.values)
+    nearest = np.argpartition(-proximity, closest - 1, axis=1)[:, :closest]
+    nearest_proximity = np.take_along_axis(proximity, nearest, axis=1)
+    # missing points are dropped from the fit by zeroing their equations
+    used = np.isfinite(nearest_proximity)
+    cosines = np.where(used, np.cos((1.0 - np.where(used, nearest_proximity, 1.0)) * np.pi), 0.0)
+    location = np.einsum("nij,nj->ni", np.linalg.pinv(xyz[nearest] * used[:, :, None]), cosines)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        location /= np.linalg.norm(location, axis=1, keepdims=True)
+    coordinates = np.degrees(np.stack([np.arcsin(np.clip(location[:, 2], -1.0, 1.0)), np.arctan2(location[:, 1], location[:, 0])], axis=1))
+    coordinates[used.sum(axis=1) < 3] = np.nan
+    return coordinates
+
+def compute_distance_matrix(distance, langs, block_size=None, fallback=False):
+    if distance not in COMPUTED_DISTANCE_SETS:
+        raise Exception("ERROR: The " + distance + " distance cannot be computed from the feature sets, only mode=\"precomputed\" is available for it.")
+    packed = pack_feature_set(COMPUTED_DISTANCE_SETS[distance], langs)
+    arr = packed_distance(packed, metric="cosine", block_size=block_size)
+    np.fill_diagonal(arr, 0.0)
+    if fallback:
+        # use the precomputed values wherever both languages have them
+        distance_language_index = get_constant("DISTANCE_LANGUAGE_INDEX")
+        known = [ i for i, l in enumerate(langs) if l in distance_language_index ]
+        if len(known) > 1 and os.path.exists(DISTANCES_FILE):
+            indeces = get_distance_indices([ langs[i] for i in known ])
+            arr[np.ix_(known, known)] = get_distance_matrix(load_distance_matrix(distance), indeces)
+    return arr
+
+def distance(distance, *args, condensed=False, stacked=False, mode="precomputed", block_size=None):
 
     if isinstance(distance, str):
         distance_list = [distance]
@@ -380,6 +1279,8 @@ def distance(distance, *args):
     for dist in distance_list:
         if dist not in DISTANCES:
             raise Exception("Unknown distance " + dist + ". The available ones are: " + ' '.join(DISTANCES))
+    if mode not in DISTANCE_MODES:
+        raise Exception("Unknown distance mode " + str(mode) + ". The available ones are: " + ' '.join(DISTANCE_MODES))
 
     if len(args) == 1 and not isinstance(args[0],list):
         raise Exception("Error: You only provided one language argument.\nProvide multiple language arguments, or a single list of languages as arguments.")
@@ -387,44 +1288,71 @@ def distance(distance, *args):
         langs = args[0]
     else:
         langs = [l for l in args]
-    for l in langs:
-        if l not in DISTANCE_LANGUAGES:
-            raise Exception("Unknown language " + l + " (or maybe we don't have precomputed distances for this one).")
-    indeces = [DISTANCE_LANGUAGES.index(l) for l in langs]
+    start = total_start = _profile_start()
+    if mode == "auto" and all(l in get_constant("DISTANCE_LANGUAGE_INDEX") for l in langs):
+        mode = "precomputed"
+    if mode == "precomputed":
+        indeces = get_distance_indices(langs)
+    start = _profile_stage("distance.resolve", start)
+    if _PROFILING:
+        _profile_count("languages_resolved", len(langs))
 
 
-    N = len(indeces)
+    N = len(langs)
     if N == 2:
         out = []
-        with zf(DISTANCES_FILE, 'r') as zp:
-            for dist in distance_list:
-                data = sparse.load_npz(zp.open(map_distance_to_filename(dist)))
-                if indeces[0] > indeces[1]:
-                    out.append(data[indeces[1],indeces[0]])
-                else:
-                    out.append(data[indeces[0],indeces[1]])
+        for dist in distance_list:
+            if mode == "precomputed":
+                data = load_distance_matrix(dist)
+                out.append(get_pair_distance(data, indeces[0], indeces[1]))
+            else:
+                out.append(compute_distance_matrix(dist, langs, block_size=block_size)[0, 1])
+        if _PROFILING:
+            _profile_stage("distance." + mode, start)
+            _profile_stage("distance", total_start)
+            _profile_count("distance_pairs", len(distance_list))
+        if stacked:
+            return np.array(out)
         if len(out) > 1:
             return out
         else:
             return out[0]
     else:
-        arr_list = [np.zeros((N,N)) for dist in distance_list]
-        with zf(DISTANCES_FILE, 'r') as zp:
-            for k,dist in enumerate(distance_list):
-                data = sparse.load_npz(zp.open(map_distance_to_filename(dist)))
-                for a,i in enumerate(indeces):
-                    for b,j in enumerate(indeces):
-                        if a != b:
-                            if i > j:
-                                arr_list[k][a,b] = data[j,i]
-                            else:
-                                arr_list[k][a,b] = data[i,j]                
+        arr_list = []
+        for dist in distance_list:
+            if mode == "precomputed":
+                data = load_distance_matrix(dist)
+                arr_list.append(get_distance_matrix(data, indeces, condensed=condensed))
+            else:
+                arr = compute_distance_matrix(dist, langs, block_size=block_size, fallback=(mode == "auto"))
+                arr_list.append(arr[np.triu_indices(N, 1)] if condensed else arr)
+        if _PROFILING:
+            _profile_stage("distance." + mode, start)
+            _profile_stage("distance", total_start)
+            _profile_count("matrix_cells", sum(arr.size for arr in arr_list))
+        if stacked:
+            return np.stack(arr_list)
         if len(arr_list) > 1:
             return arr_list
         else:
             return arr_list[0]
 
 
+def distance_pairs(distance, langs1, langs2):
+    # distances between langs1[i] and langs2[i] for every i, from the precomputed matrices;
+    # an array of shape (P,) for one distance, or (K, P) for a list of K distances
+    distance_list = [distance] if isinstance(distance, str) else distance
+    for dist in distance_list:
+        if dist not in DISTANCES:
+            raise Exception("Unknown distance " + dist + ". The available ones are: " + ' '.join(DISTANCES))
+    if len(langs1) != len(langs2):
+        raise Exception("Error: The two lists of languages have different lengths.")
+    rows, cols = get_distance_indices(langs1), get_distance_indices(langs2)
+    out = np.stack([ get_pair_distances(load_distance_matrix(dist), rows, cols) for dist in distance_list ])
+    if isinstance(distance, str):
+        return out[0]
+    return out
+
 def geographic_distance(*args):
     return distance("geographic", *args)
 
@@ -446,5 +1374,6 @@ def geographic_distance(*args):
 def syntactic_distance(*args):
     return distance("syntactic", *args)
 
-
-
+# the public names of the module, plus the lazy constants, which are not module globals
+# until first accessed, so that "from lang2vec.lang2vec import *" still binds them
+__all__ = sorted(set( name for name in globals() if not name.startswith("_") ) | set(_LAZY_CONSTANTS))
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections, json, os, sys, threading, time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lang2vec import lang2vec as l2v
+
+'''
+A long-lived local query server, so that short-lived processes do not have to import
+lang2vec and load the databases themselves (see lang2vec.client for the client side).
+Requests for the same feature set (or the same distances between pairs of languages)
+that arrive within a small window are coalesced into one vectorized call.
+
+    POST /features  {"languages": [...], "feature_set": "...", "header": false, "minimal": false}
+    POST /distance  {"distance": "..." or [...], "languages": [...]}
+    GET  /languages, /uriel_languages, /learned_languages, /distance_languages, /feature_sets
+    GET  /stats     per-endpoint request counts and latencies
+'''
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+BATCH_WINDOW = 0.002
+MAX_BATCH_SIZE = 256
+
+class Batcher(object):
+    # Collects the items submitted under the same key during `window` seconds and runs
+    # them through `function(key, items)` at once, which returns one result per item.
+    # If a batch fails (e.g. one unknown language), its items are retried one by one so
+    # that the error only reaches the request that caused it.
+    def __init__(self, function, window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE):
+        self.function = function
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def submit(self, key, item):
+        with self.lock:
+            batch = self.pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = {"items": [], "done": threading.Event(), "results": None}
+                self.pending[key] = batch
+            index = len(batch["items"])
+            batch["items"].append(item)
+            if len(batch["items"]) >= self.max_batch_size:
+                self.pending.pop(key, None)
+        if leader:
+            time.sleep(self.window)
+            with self.lock:
+                if self.pending.get(key) is batch:
+                    del self.pending[key]
+            self._run(key, batch)
+        else:
+            batch["done"].wait()
+        result = batch["results"][index]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run(self, key, batch):
+        try:
+            batch["results"] = self.function(key, batch["items"])
+        except Exception:
+            results = []
+            for item in batch["items"]:
+                try:
+                    results.append(self.function(key, [item])[0])
+                except Exception as e:
+                    results.append(e)
+            batch["results"] = results
+        finally:
+            batch["done"].set()
+
+class LatencyStats(object):
+    def __init__(self, size=10000):
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.errors = collections.Counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=size))
+
+    def record(self, endpoint, seconds, error=False):
+        with self.lock:
+            self.counts[endpoint] += 1
+            if error:
+                self.errors[endpoint] += 1
+            self.latencies[endpoint].append(seconds)
+
+    def report(self):
+        with self.lock:
+            report = {}
+            for endpoint, latencies in self.latencies.items():
+                latencies = np.array(latencies) * 1000.0
+                report[endpoint] = {
+                    "count": self.counts[endpoint],
+                    "errors": self.errors[endpoint],
+                    "mean_ms": float(latencies.mean()),
+                    "p50_ms": float(np.percentile(latencies, 50)),
+                    "p95_ms": float(np.percentile(latencies, 95)),
+                    "p99_ms": float(np.percentile(latencies, 99)),
+                    "max_ms": float(latencies.max()),
+                }
+            return report
+
+def _features_batch(feature_set, requests):
+    # one gather for all the languages of the coalesced requests
+    languages = [ lang for request in requests for lang in request["languages"] ]
+    result = l2v.get_features(languages, feature_set, output="array", dtype=np.float64, missing="mask")
+    outputs = []
+    start = 0
+    for request in requests:
+        end = start + len(request["languages"])
+        values, mask, feature_names = result.values[start:end], result.mask[start:end], result.feature_names
+        if request.get("minimal"):
+            unmasked = np.logical_not(l2v.get_minimal_mask(np.where(mask, -1.0, values)))
+            values, mask, feature_names = values[:, unmasked], mask[:, unmasked], feature_names[unmasked]
+        output = {}
+        if request.get("header"):
+            output["CODE"] = feature_names.tolist()
+        for lang, row, row_mask in zip(request["languages"], values.tolist(), mask.tolist()):
+            output[lang] = [ '--' if m else v for v, m in zip(row, row_mask) ]
+        outputs.append(output)
+        start = end
+    return outputs
+
+def _distance_batch(distances, requests):
+    if len(requests) == 1 and len(requests[0]["languages"]) != 2:
+        result = l2v.distance(list(distances), requests[0]["languages"], stacked=True)
+        return [ _distance_output(request["distance"], result) for request in requests ]
+    # pairs: one vectorized lookup for the whole batch
+    langs1 = [ request["languages"][0] for request in requests ]
+    langs2 = [ request["languages"][1] for request in requests ]
+    result = l2v.distance_pairs(list(distances), langs1, langs2)
+    return [ _distance_output(request["distance"], result[:, i]) for i, request in enumerate(requests) ]
+
+def _distance_output(distance, result):
+    result = np.asarray(result).tolist()
+    return result[0] if isinstance(distance, str) else result
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, window=BATCH_WINDOW):
+        ThreadingHTTPServer.__init__(self, address, QueryHandler)
+        self.stats = LatencyStats()
+        self.features_batcher = Batcher(_features_batch, window=window)
+        self.distance_batcher = Batcher(_distance_batch, window=window)
+
+    def features(self, request):
+        languages = request.get("languages")
+        if isinstance(languages, str):
+            languages = languages.split()
+        request = dict(request, languages=languages)
+        feature_set = request.get("feature_set")
+        if isinstance(feature_set, list):
+            feature_set = "+".join(feature_set)
+        return self.features_batcher.submit(feature_set, request)
+
+    def distance(self, request):
+        distance = request.get("distance")
+        languages = request.get("languages")
+        distances = (distance,) if isinstance(distance, str) else tuple(distance)
+        if len(languages) != 2:
+            # matrices are not coalesced
+            return _distance_batch(distances, [request])[0]
+        return self.distance_batcher.submit(distances, request)
+
+GET_ENDPOINTS = {
+    "/languages": lambda: sorted(l2v.LANGUAGES),
+    "/uriel_languages": lambda: sorted(l2v.URIEL_LANGUAGES),
+    "/learned_languages": lambda: sorted(l2v.LEARNED_LANGUAGES),
+    "/distance_languages": lambda: l2v.DISTANCE_LANGUAGES,
+    "/feature_sets": lambda: l2v.FEATURE_SETS,
+}
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, endpoint, function):
+        start = time.perf_counter()
+        error = False
+        try:
+            status, payload = 200, function()
+        except Exception as e:
+            error = True
+            status, payload = 400, {"error": str(e)}
+        self.server.stats.record(endpoint, time.perf_counter() - start, error=error)
+        self._respond(status, payload)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._respond(200, self.server.stats.report())
+        elif self.path in GET_ENDPOINTS:
+            self._handle(self.path, GET_ENDPOINTS[self.path])
+        else:
+            self._respond(404, {"error": "Unknown endpoint " + self.path})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        except ValueError as e:
+            self._respond(400, {"error": "Invalid JSON: " + str(e)})
+            return
+        if self.path == "/features":
+            self._handle(self.path, lambda: self.server.features(request))
+        elif self.path == "/distance":
+            self._handle(self.path, lambda: self.server.distance(request))
+        else:
+            self._respond(404, {"error": "Unknown endpoint " + self.path})
+
+def preload():
+    # keep every database resident for the lifetime of the server
+    l2v.set_cache_size(None)
+    for filename in set(filename for filename, source, prefix in l2v.FEATURE_SETS_DICT.values()):
+        if os.path.exists(l2v.get_database_path(filename)):
+            l2v.load_database(filename)
+    if os.path.exists(l2v.DISTANCES_FILE):
+        for dist in l2v.DISTANCES:
+            l2v.load_distance_matrix(dist)
+    l2v.get_constant("LANGUAGES")
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, window=BATCH_WINDOW, load=True):
+    if load:
+        preload()
+    server = QueryServer((host, port), window=window)
+    print("lang2vec server listening on http://" + host + ":" + str(server.server_address[1]), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -5,7 +5,6 @@ with open("README.md", "r") as fh:
     long_description = fh.read()
 
 install_requires = ['numpy',
-                    'setuptools',
 					'scipy']
 
 
@@ -19,11 +18,11 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/antonisa/lang2vec",
     install_requires=install_requires,
-    scripts=['lang2vec/lang2vec.py'],
+    entry_points={'console_scripts': ['lang2vec=lang2vec.cli:main']},
     packages=['lang2vec'],
     package_dir={'lang2vec': 'lang2vec'},
     package_data={'lang2vec': ['data/*.npz', 'data/*.json', 'data/distances2.zip', 'data/learned.npy', 'data/distances_languages.txt']},
-    zip_safe=True,
+    zip_safe=False,
     classifiers=['Operating System :: OS Independent',
                'Programming Language :: Python :: 3',
                'Topic :: Software Development :: Libraries :: Python Modules',